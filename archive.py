@@ -0,0 +1,53 @@
+# archive.py
+import asyncio
+import config
+import database
+
+ARCHIVE_INTERVAL = getattr(config, "ARCHIVE_INTERVAL", 3600)
+ARCHIVE_BATCH_SIZE = getattr(config, "ARCHIVE_BATCH_SIZE", 500)
+# مکث بین دو دسته تا نوشتن‌های هندلرها بین تراکنش‌های بایگانی انجام شوند
+ARCHIVE_BATCH_PAUSE = getattr(config, "ARCHIVE_BATCH_PAUSE", 0.2)
+# عمر (روز) ردیف‌هایی که بایگانی می‌شوند؛ None یعنی بایگانی آن جدول غیرفعال است
+ARCHIVE_AFTER_DAYS = {
+    "subscriber_orders": getattr(config, "ARCHIVE_COMPLETED_ORDERS_AFTER_DAYS", 7),
+    "joined_channels": getattr(config, "ARCHIVE_JOINS_AFTER_DAYS", 90),
+    "coin_orders": getattr(config, "ARCHIVE_COIN_ORDERS_AFTER_DAYS", 30),
+    "transactions": getattr(config, "ARCHIVE_TRANSACTIONS_AFTER_DAYS", 90),
+}
+
+# جلوگیری از اجرای همزمان دو بایگانی در یک پردازه
+_archive_lock = asyncio.Lock()
+
+async def run_archive(batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_BATCH_PAUSE, after_days=None):
+    """
+    انتقال ردیف‌های قدیمی همه‌ی جدول‌ها به جدول‌های بایگانی، دسته به دسته.
+    هر دسته یک تراکنش کوتاه روی رشته‌ی نویسنده‌ی database.aio است و بین دسته‌ها pause ثانیه مکث می‌شود.
+    خروجی: تعداد ردیف منتقل‌شده‌ی هر جدول
+    """
+    after_days = {**ARCHIVE_AFTER_DAYS, **(after_days or {})}
+    moved = {}
+    for table, days in after_days.items():
+        if days is None:
+            continue
+        moved[table] = 0
+        while True:
+            count = await database.aio.archive_batch(table, days, batch_size)
+            moved[table] += count
+            if count < batch_size:
+                break
+            await asyncio.sleep(pause)
+    return moved
+
+async def archive_job(context):
+    """job دوره‌ای بایگانی"""
+    if _archive_lock.locked():
+        return
+    async with _archive_lock:
+        moved = await run_archive()
+    if any(moved.values()):
+        print("Archive finished:", ", ".join(f"{table} {count}" for table, count in moved.items()))
+
+def register_archive_job(app):
+    """ثبت job دوره‌ای بایگانی روی job_queue"""
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(archive_job, interval=ARCHIVE_INTERVAL, first=300, name="archive")
@@ -0,0 +1,83 @@
+# benchmarks/bench_archive.py
+"""
+اثر بایگانی (archive_batch) روی کوئری‌های پرتکرار و مدت قفل نوشتن هر دسته.
+جدول‌ها با ردیف‌های قدیمی (سفارش‌های تکمیل‌شده، عضویت‌ها، تراکنش‌ها و خریدهای سکه‌ی بررسی‌شده)
+و چند سفارش باز پر می‌شوند؛ کوئری‌ها قبل و بعد از بایگانی اندازه‌گیری می‌شوند و مدت هر دسته
+(یعنی زمانی که قفل نوشتن نگه داشته می‌شود) گزارش می‌شود.
+اجرا:  python benchmarks/bench_archive.py [تعداد ردیف قدیمی هر جدول، پیش‌فرض 200000]
+"""
+import random
+import sys
+import time
+
+from common import load_database, measure, report
+
+OPEN_ORDERS = 2000
+
+def populate(database, count):
+    conn = database.get_connection()
+    rng = random.Random(42)
+    old = "datetime('now', '-200 days')"
+    conn.executemany(f"""
+        INSERT INTO subscriber_orders (user_id, channel_username, required, current, created_at, priority_score, rand_key)
+        VALUES (?, ?, 100, 100, {old}, 0, ?)
+    """, [(rng.randrange(1, 10000), f"@done_{i}", rng.random()) for i in range(count)])
+    conn.executemany(f"""
+        INSERT INTO joined_channels (user_id, channel_username, join_type, order_id, created_at)
+        VALUES (?, ?, 'order', ?, {old})
+    """, [(i % 5000, f"@done_{i}", i + 1) for i in range(count)])
+    conn.executemany(f"INSERT INTO transactions (type, amount, description, date) VALUES ('join_reward', 1, '', {old})",
+                     [()] * count)
+    conn.executemany(f"""
+        INSERT INTO coin_orders (user_id, quantity, price, receipt_file_id, status, created_at)
+        VALUES (?, 100, 1000, 'file', 'approved', {old})
+    """, [(rng.randrange(1, 10000),) for _ in range(count)])
+    conn.commit()
+    for i in range(OPEN_ORDERS):
+        database.create_subscriber_order(rng.randrange(1, 10000), f"@open_{i}", 1000)
+
+def hot_queries(database):
+    collector_id = 1
+    return {
+        "get_weighted_orders": lambda: database.get_weighted_orders(collector_id),
+        "get_recent_orders": lambda: database.get_recent_orders(collector_id),
+        "get_ending_orders": lambda: database.get_ending_orders(collector_id),
+        "user_has_joined_channel": lambda: database.user_has_joined_channel(collector_id, "@done_1"),
+        "get_coin_order": lambda: database.get_coin_order(1),
+        "get_transactions": lambda: database.get_transactions(20),
+    }
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    database = load_database()
+    print(f"populating {count} old rows per table and {OPEN_ORDERS} open orders ...")
+    populate(database, count)
+
+    for name, func in hot_queries(database).items():
+        report(f"before {name}", measure(func, repeat=50, warmup=5))
+
+    batch_timings = []
+    for table in database.ARCHIVE_COLUMNS:
+        moved = 0
+        while True:
+            started = time.perf_counter()
+            batch = database.archive_batch(table, 30, 500)
+            batch_timings.append((time.perf_counter() - started) * 1000)
+            moved += batch
+            if batch < 500:
+                break
+        print(f"archived {moved} {table} rows")
+    report("archive_batch (write lock held)", batch_timings)
+
+    for name, func in hot_queries(database).items():
+        report(f"after {name}", measure(func, repeat=50, warmup=5))
+
+    # رفتار شفاف بایگانی: خرید قدیمی پیدا می‌شود و عضویت بایگانی‌شده دوباره پاداش نمی‌گیرد
+    assert database.get_coin_order(1) is not None
+    assert database.user_has_joined_channel(1, "@done_1")
+    order_id = database.create_subscriber_order(99999, "@done_1", 10)
+    assert not database.credit_collector(1, order_id, "@done_1", 1)
+    print("archive fallbacks ok")
+
+if __name__ == "__main__":
+    main()
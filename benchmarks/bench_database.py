@@ -0,0 +1,121 @@
+# benchmarks/bench_database.py
+"""
+بنچمارک توابع پرتکرار ماژول database روی جدول‌هایی با ۱۰ هزار، ۱۰۰ هزار و ۱ میلیون ردیف.
+هر اندازه در یک پردازه‌ی جدا و با دیتابیس موقت تازه اجرا می‌شود تا کش‌ها و اتصال‌ها روی هم اثر نگذارند.
+برای هر تابع p50/p95/p99 و برای توابع نوشتنی تعداد commit در هر فراخوانی گزارش می‌شود.
+
+اجرا:  python benchmarks/bench_database.py [اندازه‌ها، پیش‌فرض 10000 100000 1000000]
+"""
+import random
+import subprocess
+import sys
+
+from common import load_database, measure, report
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+BATCH_SIZE = 50_000
+
+def _batched(rows_iter, size=BATCH_SIZE):
+    batch = []
+    for row in rows_iter:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def populate(database, rows):
+    """
+    rows کاربر و rows عضویت، rows/10 سفارش عضو و سفارش سکه، rows تراکنش و rows/20 ارجاع.
+    داده‌ها با executemany درج می‌شوند؛ امتیاز و rand_key سفارش‌ها مثل create_subscriber_order حساب می‌شود.
+    """
+    conn = database.get_connection()
+    rng = random.Random(42)
+    orders = max(1, rows // 10)
+
+    def insert(sql, rows_iter):
+        for batch in _batched(rows_iter):
+            conn.executemany(sql, batch)
+            conn.commit()
+
+    insert("INSERT INTO users (user_id, phone, coin_balance) VALUES (?, ?, ?)",
+           ((user_id, f"09{rng.randrange(10 ** 9):09d}", rng.randrange(1000)) for user_id in range(1, rows + 1)))
+    insert("INSERT INTO subscriber_orders (user_id, channel_username, required, current) VALUES (?, ?, ?, ?)",
+           ((rng.randrange(1, rows + 1), f"@channel_{i}", 100, rng.randrange(100)) for i in range(orders)))
+    conn.execute(f"""
+        UPDATE subscriber_orders
+        SET priority_score = {database.order_score_sql()}, rand_key = {database.RANDOM_KEY_SQL}
+    """)
+    conn.commit()
+    insert("INSERT OR IGNORE INTO joined_channels (user_id, channel_username, join_type, order_id) VALUES (?, ?, 'order', ?)",
+           ((rng.randrange(1, rows + 1), f"@channel_{order_id - 1}", order_id)
+            for order_id in (rng.randrange(1, orders + 1) for _ in range(rows))))
+    insert("INSERT INTO coin_orders (user_id, quantity, price, receipt_file_id) VALUES (?, ?, ?, 'file')",
+           ((rng.randrange(1, rows + 1), 100, 10.0) for _ in range(orders)))
+    insert("INSERT INTO transactions (type, amount, description) VALUES ('join_reward', 1, '')",
+           (() for _ in range(rows)))
+    insert("INSERT OR IGNORE INTO referrals (referrer_id, referred_user_id) VALUES (?, ?)",
+           ((rng.randrange(1, 1000), rng.randrange(1, rows + 1)) for _ in range(max(1, rows // 20))))
+    conn.execute("ANALYZE")
+    conn.commit()
+
+def run_size(rows):
+    database = load_database()
+    print(f"\n=== {rows} rows ===")
+    populate(database, rows)
+    rng = random.Random(7)
+    orders = max(1, rows // 10)
+    user = lambda: rng.randrange(1, rows + 1)
+    order = lambda: rng.randrange(1, orders + 1)
+
+    reads = {
+        "get_user": lambda: database.get_user(user()),
+        "get_weighted_orders": lambda: database.get_weighted_orders(user()),
+        "get_random_orders": lambda: database.get_random_orders(user()),
+        "get_recent_orders": lambda: database.get_recent_orders(user()),
+        "get_ending_orders": lambda: database.get_ending_orders(user()),
+        "user_has_joined_channel": lambda: database.user_has_joined_channel(user(), f"@channel_{order() - 1}"),
+        "get_user_channels": lambda: database.get_user_channels(user()),
+        "get_available_coin_orders": lambda: database.get_available_coin_orders(user()),
+        "get_coin_order": lambda: database.get_coin_order(order()),
+        "get_referral_count": lambda: database.get_referral_count(rng.randrange(1, 1000)),
+        "get_user_ids_batch": lambda: database.get_user_ids_batch(user(), 500),
+        "get_paid_joins_batch": lambda: database.get_paid_joins_batch(user(), 200),
+        "get_users_page": lambda: database.get_users_page(user(), 50),
+        "search_users": lambda: database.search_users(str(rng.randrange(100000, 999999))),
+        "get_transactions": lambda: database.get_transactions(),
+    }
+    for name, func in reads.items():
+        report(name, measure(func, repeat=200, warmup=10))
+
+    new_user = iter(range(rows + 1, rows + 10 ** 7))
+
+    def credit():
+        order_id = order()
+        return database.credit_collector(next(new_user), order_id, f"@channel_{order_id - 1}", 1)
+
+    writes = {
+        "update_user_coins": lambda: database.update_user_coins(user(), 1),
+        "add_transaction": lambda: database.add_transaction("join_reward", 1, "bench"),
+        "create_subscriber_order": lambda: database.create_subscriber_order(user(), f"@new_{user()}", 100),
+        "update_order_current": lambda: database.update_order_current(order()),
+        "credit_collector": credit,
+        "register_referral": lambda: database.register_referral(rng.randrange(1, 1000), next(new_user)),
+    }
+    for name, func in writes.items():
+        before = database.db_stats["commits"]
+        timings = measure(func, repeat=200, warmup=10)
+        commits = (database.db_stats["commits"] - before) / 210
+        report(f"{name} ({commits:.1f} commits/call)", timings)
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--size":
+        run_size(int(sys.argv[2]))
+        return
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    for rows in sizes:
+        subprocess.run([sys.executable, __file__, "--size", str(rows)], check=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# benchmarks/bench_outbound.py
+"""
+آزمون زمان‌بند خروجی Bot API (outbound.py) در برابر سرور محلی fake_bot_api که مثل تلگرام بیش از
+--server-rate درخواست در ثانیه را با 429 رد می‌کند.
+
+بار همزمان:
+  background   --background پیام همگانی به چت‌های مختلف، داخل background_requests()
+  interactive  --interactive پاسخ به کاربران که هر --interval ثانیه یکی می‌رسد
+  members      --members فراخوانی همزمان get_chat_member با (چت، کاربر) یکسان
+
+هر حالت یک بار بدون زمان‌بند (HTTPXRequest خام) و یک بار با ScheduledRequest اجرا می‌شود.
+خروجی: تأخیر هر صف، تعداد خطاهای RetryAfter رسیده به فراخواننده، تعداد 429 دیده‌شده در سرور
+و تعداد درخواست واقعی getChatMember.
+
+اجرا:  python benchmarks/bench_outbound.py --background 300 --interactive 40
+"""
+import argparse
+import asyncio
+import time
+
+from common import install_config, report
+from fake_bot_api import FakeBotAPI
+
+BENCH_TOKEN = "123456:bench"
+FIRST_CHAT_ID = 20_000_000
+
+async def timed(coroutine, timings, errors):
+    started = time.perf_counter()
+    try:
+        await coroutine
+    except Exception as e:
+        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        return
+    timings.append((time.perf_counter() - started) * 1000)
+
+async def run_case(name, request, server, args):
+    from telegram import Bot
+    from outbound import background_requests
+
+    bot = Bot(BENCH_TOKEN, base_url=server.base_url, request=request)
+    server.calls.clear()
+    server.throttled = 0
+    lanes = {"background": [], "interactive": [], "members": []}
+    errors = {lane: {} for lane in lanes}
+
+    async def background():
+        with background_requests():
+            await asyncio.gather(*(
+                timed(bot.send_message(chat_id=FIRST_CHAT_ID + i, text="broadcast"),
+                      lanes["background"], errors["background"])
+                for i in range(args.background)
+            ))
+
+    async def interactive():
+        tasks = []
+        for i in range(args.interactive):
+            await asyncio.sleep(args.interval)
+            tasks.append(asyncio.create_task(
+                timed(bot.send_message(chat_id=FIRST_CHAT_ID - 1 - i, text="reply"),
+                      lanes["interactive"], errors["interactive"])
+            ))
+        await asyncio.gather(*tasks)
+
+    async def members():
+        await asyncio.sleep(args.interval)
+        await asyncio.gather(*(
+            timed(bot.get_chat_member(chat_id="@bench_forced", user_id=FIRST_CHAT_ID),
+                  lanes["members"], errors["members"])
+            for _ in range(args.members)
+        ))
+
+    async with bot:
+        started = time.perf_counter()
+        await asyncio.gather(background(), interactive(), members())
+        elapsed = time.perf_counter() - started
+
+    print(f"\n== {name} ({elapsed:.1f}s) ==")
+    for lane, timings in lanes.items():
+        if timings:
+            report(f"{name} {lane}", timings)
+        if errors[lane]:
+            print(f"{'':<40} errors: {errors[lane]}")
+    print(f"{'':<40} server 429s: {server.throttled}  getChatMember calls: {server.calls['getChatMember']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--background", type=int, default=300)
+    parser.add_argument("--interactive", type=int, default=40)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--server-rate", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    install_config(METRICS_ENABLED=False)
+    from telegram.request import HTTPXRequest
+    from outbound import ScheduledRequest
+
+    server = FakeBotAPI(latency=args.latency, max_rate=args.server_rate).start()
+    try:
+        asyncio.run(run_case("direct", HTTPXRequest(connection_pool_size=256), server, args))
+        asyncio.run(run_case("scheduled", ScheduledRequest(), server, args))
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_rows.py
+"""
+مقایسه‌ی dict_factory با کلاس‌های ردیف rows.py هنگام خواندن کل جدول (مثل get_all_joined_members):
+زمان fetchall، تعداد ردیف در ثانیه و حافظه‌ی نگه‌داشته‌شده برای نتیجه (با tracemalloc).
+اجرا:  python benchmarks/bench_rows.py [تعداد ردیف، پیش‌فرض 200000]
+"""
+import gc
+import random
+import sys
+import tracemalloc
+
+from common import load_database, measure, report
+
+def populate(database, count):
+    conn = database.get_connection()
+    rng = random.Random(42)
+    conn.executemany(
+        "INSERT INTO joined_channels (user_id, channel_username, join_type, order_id) VALUES (?, ?, 'order', ?)",
+        [(i, f"@channel_{rng.randrange(1000)}", rng.randrange(1, 10000)) for i in range(count)],
+    )
+    conn.executemany(
+        "INSERT INTO subscriber_orders (user_id, channel_username, required, current) VALUES (?, ?, 100, ?)",
+        [(rng.randrange(1, count), f"@channel_{i}", rng.randrange(100)) for i in range(count)],
+    )
+    conn.commit()
+
+def fetch(database, factory, query):
+    conn = database.get_connection()
+    cur = conn.cursor()
+    cur.row_factory = factory
+    cur.execute(query)
+    return cur.fetchall()
+
+def retained_memory(func):
+    """حافظه‌ی نگه‌داشته‌شده توسط خروجی func (بایت)"""
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    database = load_database()
+    from rows import JoinedChannelRow, SubscriberOrderRow
+    print(f"populating {count} joined_channels and subscriber_orders rows ...")
+    populate(database, count)
+
+    cases = [
+        ("joined_channels", "SELECT * FROM joined_channels", JoinedChannelRow),
+        ("subscriber_orders", "SELECT * FROM subscriber_orders", SubscriberOrderRow),
+    ]
+    for table, query, row_class in cases:
+        # تاپل خام (بدون row_factory) فقط مبنای مقایسه است: هزینه‌ی خود SQLite
+        for name, factory in (("tuple", None), ("dict_factory", database.dict_factory), (row_class.__name__, row_class)):
+            timings = measure(lambda: fetch(database, factory, query), repeat=5, warmup=1)
+            memory = retained_memory(lambda: fetch(database, factory, query))
+            report(f"{table} {name}", timings)
+            best = min(timings) / 1000
+            print(f"{'':<40} {count / best:,.0f} rows/s  {memory / count:.0f} bytes/row ({memory / 2 ** 20:.1f} MiB)")
+
+    # دسترسی به ستون‌ها در حلقه‌ی داغ (مثل ساختن کیبورد سفارش‌ها)
+    dict_rows = fetch(database, database.dict_factory, "SELECT * FROM subscriber_orders")
+    class_rows = fetch(database, SubscriberOrderRow, "SELECT * FROM subscriber_orders")
+    for name, rows in (("dict_factory", dict_rows), ("SubscriberOrderRow", class_rows)):
+        timings = measure(lambda: sum(row["required"] - row["current"] for row in rows), repeat=5, warmup=1)
+        report(f"column access {name}", timings)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# benchmarks/bench_search.py
+"""
+مقایسه‌ی search_users (ایندکس trigram) با کوئری قدیمی LIKE '%q%' روی CAST(user_id AS TEXT).
+اجرا:  python benchmarks/bench_search.py [تعداد کاربران، پیش‌فرض 1000000]
+"""
+import random
+import sys
+
+from common import load_database, measure, report
+
+LEGACY_QUERY = "SELECT * FROM users WHERE phone LIKE ? OR CAST(user_id AS TEXT) LIKE ?"
+
+def populate(database, count, batch_size=50000):
+    conn = database.get_connection()
+    rng = random.Random(42)
+    for start in range(1, count + 1, batch_size):
+        rows = [(user_id, f"09{rng.randrange(10 ** 9):09d}")
+                for user_id in range(start, min(start + batch_size, count + 1))]
+        conn.executemany("INSERT INTO users (user_id, phone) VALUES (?, ?)", rows)
+        conn.commit()
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    database = load_database()
+    print(f"populating {count} users ...")
+    populate(database, count)
+    conn = database.get_connection()
+    queries = ["1234567", "98765", "0912", "4242", "77"]
+    for query in queries:
+        legacy = measure(lambda: conn.execute(LEGACY_QUERY, (f"%{query}%", f"%{query}%")).fetchall(), repeat=5, warmup=1)
+        indexed = measure(lambda: database.search_users(query), repeat=20)
+        report(f"legacy LIKE   q={query!r}", legacy)
+        report(f"search_users  q={query!r}", indexed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# benchmarks/bench_webhook.py
+"""
+آزمون بار محلی مسیر وب‌هوک: آپدیت‌های ساختگی تلگرام به webhook() در Flask فرستاده می‌شوند و
+bot_app با همه‌ی هندلرهای واقعی آن‌ها را پردازش می‌کند؛ Bot API با سرور محلی fake_bot_api جایگزین شده است.
+
+سناریوها (برای هر کاربر به ترتیب):
+  start       /start
+  membership  دکمه‌ی «بررسی عضویت» (getChatMember برای هر کانال اجباری)
+  collect     دکمه‌ی «جمع‌آوری سکه» (خواندن سفارش‌ها)
+  order       شروع ثبت سفارش عضو، نام کانال، تعداد و در پایان /cancel
+
+خروجی: p50/p95/p99 تأخیر هر سناریو (از ورود به webhook تا پایان process_update)،
+تعداد آپدیت در ثانیه، تعداد commit دیتابیس و تعداد فراخوانی هر متد Bot API.
+
+اجرا:  python benchmarks/bench_webhook.py --users 200 --latency 0.05
+فایل ربات به طور پیش‌فرض اولین bot*.py ریشه‌ی مخزن است (با --bot-file قابل تغییر).
+"""
+import argparse
+import importlib.util
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from common import load_database, module_path, percentile, report
+from fake_bot_api import FakeBotAPI
+
+BENCH_TOKEN = "123456:bench"
+FIRST_USER_ID = 10_000_000
+BUTTON_COLLECT = "💰 جمع‌آوری سکه"
+BUTTON_ADD_MEMBERS = "👥 اضافه کردن عضو"
+
+def load_bot(path):
+    spec = importlib.util.spec_from_file_location("bench_bot_module", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def seed(database, users, forced_channels, orders, coins):
+    """کاربران با موجودی، کانال‌های اجباری و سفارش‌های فعال برای صفحه‌ی جمع‌آوری سکه"""
+    conn = database.get_connection()
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (user_id, phone, coin_balance) VALUES (?, ?, ?)",
+        [(FIRST_USER_ID + i, f"0900{i:07d}", coins) for i in range(users)],
+    )
+    conn.commit()
+    for i in range(forced_channels):
+        database.add_forced_channel(f"@bench_forced_{i}", "members", 10 ** 9)
+    for i in range(orders):
+        database.create_subscriber_order(FIRST_USER_ID + i % max(1, users), f"@bench_order_{i}", 1000)
+
+# ==================== ساخت آپدیت‌ها ====================
+def message_update(update_id, user_id, text):
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+def build_scenarios(check_membership_button):
+    return {
+        "start": lambda user_id: ["/start"],
+        "membership": lambda user_id: [check_membership_button],
+        "collect": lambda user_id: [BUTTON_COLLECT],
+        "order": lambda user_id: [BUTTON_ADD_MEMBERS, f"@bench_channel_{user_id}", "10", "/cancel"],
+    }
+
+def build_updates(users, rounds, scenarios):
+    """فهرست آپدیت‌های هر کاربر به ترتیب ارسال: {user_id: [(scenario, update), ...]}"""
+    per_user = defaultdict(list)
+    update_id = 1
+    for _ in range(rounds):
+        for name, texts in scenarios.items():
+            for i in range(users):
+                user_id = FIRST_USER_ID + i
+                for text in texts(user_id):
+                    per_user[user_id].append((name, message_update(update_id, user_id, text)))
+                    update_id += 1
+    return per_user
+
+# ==================== اندازه‌گیری ====================
+class TimedApplication:
+    """پوشش bot_app که زمان پایان پردازش هر آپدیت را ثبت می‌کند؛ بقیه‌ی صفات به خود bot_app می‌رسد"""
+
+    def __init__(self, application, expected):
+        self._application = application
+        self._expected = expected
+        self._lock = threading.Lock()
+        self.submitted = {}
+        self.latencies = defaultdict(list)
+        self.processed = 0
+        self.done = threading.Event()
+
+    def __getattr__(self, name):
+        return getattr(self._application, name)
+
+    async def process_update(self, update):
+        try:
+            await self._application.process_update(update)
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                entry = self.submitted.pop(update.update_id, None)
+                if entry is not None:
+                    name, started = entry
+                    self.latencies[name].append((finished - started) * 1000)
+                self._count_processed()
+
+    def start(self, update_id, name):
+        with self._lock:
+            self.submitted[update_id] = (name, time.perf_counter())
+
+    def reject(self, update_id):
+        """آپدیتی که با 503 رد شد دیگر پردازش نمی‌شود"""
+        with self._lock:
+            self.submitted.pop(update_id, None)
+            self._count_processed()
+
+    def _count_processed(self):
+        self.processed += 1
+        if self.processed >= self._expected:
+            self.done.set()
+
+def run_load(bot_module, timed, per_user, clients):
+    """ارسال آپدیت‌ها از clients رشته؛ آپدیت‌های هر کاربر همیشه از یک رشته و به ترتیب فرستاده می‌شوند"""
+    shards = defaultdict(list)
+    for user_id, updates in per_user.items():
+        shards[user_id % clients].append(updates)
+    rejected = [0]
+    rejected_lock = threading.Lock()
+    path = f"/{BENCH_TOKEN}"
+
+    def client(user_updates):
+        http = bot_module.app.test_client()
+        # کاربران یک رشته به صورت نوبتی ارسال می‌کنند تا ترتیب هر کاربر حفظ شود
+        for batch in _round_robin(user_updates):
+            for name, update in batch:
+                timed.start(update["update_id"], name)
+                response = http.post(path, json=update)
+                if response.status_code != 200:
+                    timed.reject(update["update_id"])
+                    with rejected_lock:
+                        rejected[0] += 1
+
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client, shards.values()))
+    return rejected[0]
+
+def _round_robin(user_updates):
+    position = 0
+    while True:
+        batch = [updates[position] for updates in user_updates if position < len(updates)]
+        if not batch:
+            return
+        yield batch
+        position += 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=8, help="تعداد رشته‌های ارسال‌کننده‌ی وب‌هوک")
+    parser.add_argument("--latency", type=float, default=0.05, help="تأخیر هر فراخوانی Bot API (ثانیه)")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--member-ratio", type=float, default=0.9, help="احتمال عضو بودن در getChatMember")
+    parser.add_argument("--forced-channels", type=int, default=2)
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--mode", choices=("queue", "inline"), default="queue")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--bot-file", default=module_path("bot"))
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, member_ratio=args.member_ratio).start()
+    database = load_database(
+        BOT_TOKEN=BENCH_TOKEN,
+        BOT_API_BASE_URL=api.base_url,
+        ADMIN_ID=1,
+        WEBHOOK_MODE=args.mode,
+        WEBHOOK_WORKERS=args.workers,
+        WRITE_BEHIND_ENABLED=args.write_behind,
+    )
+    seed(database, args.users, args.forced_channels, args.orders, coins=1000)
+
+    bot_module = load_bot(args.bot_file)
+    from handlers.utils import BUTTON_CHECK_MEMBERSHIP
+
+    per_user = build_updates(args.users, args.rounds, build_scenarios(BUTTON_CHECK_MEMBERSHIP))
+    total = sum(len(updates) for updates in per_user.values())
+    timed = TimedApplication(bot_module.bot_app, total)
+    bot_module.pipeline.application = timed
+    # راه‌اندازی حلقه و bot_app خارج از زمان‌سنجی
+    bot_module.pipeline.ensure_started()
+    api.calls.clear()
+
+    print(f"replaying {total} updates from {args.users} users "
+          f"(mode={args.mode}, workers={args.workers}, api latency={args.latency * 1000:.0f}ms)")
+    commits_before = database.db_stats["commits"]
+    started = time.perf_counter()
+    rejected = run_load(bot_module, timed, per_user, args.clients)
+    if not timed.done.wait(timeout=max(60.0, total * (args.latency + 0.01))):
+        print(f"timed out: {timed.processed}/{total} updates processed")
+    database.flush_pending_writes()
+    elapsed = time.perf_counter() - started
+    commits = database.db_stats["commits"] - commits_before
+
+    all_latencies = []
+    for name, timings in timed.latencies.items():
+        report(f"webhook {name}", timings)
+        all_latencies.extend(timings)
+    if all_latencies:
+        report("webhook all", all_latencies)
+        print(f"p50/p95/p99 overall: {percentile(all_latencies, 0.5):.1f} / "
+              f"{percentile(all_latencies, 0.95):.1f} / {percentile(all_latencies, 0.99):.1f} ms")
+    print(f"throughput: {timed.processed / elapsed:.1f} updates/s ({timed.processed} in {elapsed:.2f}s, "
+          f"{rejected} rejected with 503)")
+    print(f"sqlite commits: {commits} ({commits / max(1, timed.processed):.2f} per update)")
+    print("bot api calls: " + ", ".join(f"{method}={count}" for method, count in api.calls.most_common()))
+
+    bot_module.pipeline.stop()
+    api.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/common.py
+"""
+ابزارهای مشترک بنچمارک‌ها.
+بنچمارک‌ها هرگز به دیتابیس اصلی دست نمی‌زنند: قبل از import ماژول database یک config موقت
+با DATABASE_NAME در پوشه‌ی موقت جایگزین می‌شود.
+"""
+import glob
+import importlib.util
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def install_config(db_path=None, **settings):
+    """جایگزینی ماژول config با یک config موقت (پیش از import ماژول‌های ربات)"""
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="tbot-bench-"), "bench.db")
+    config = types.ModuleType("config")
+    config.DATABASE_NAME = db_path
+    config.INITIAL_COINS = 0
+    config.ADMIN_ID = 0
+    config.BOT_TOKEN = "0:bench"
+    for name, value in settings.items():
+        setattr(config, name, value)
+    sys.modules["config"] = config
+    return config
+
+def module_path(name):
+    """مسیر فایل ماژول؛ در نبود name.py اولین name*.py ریشه‌ی مخزن (مثل «database (7).py»)"""
+    path = os.path.join(ROOT, f"{name}.py")
+    if os.path.exists(path):
+        return path
+    candidates = sorted(glob.glob(os.path.join(ROOT, f"{name}*.py")))
+    return candidates[0] if candidates else path
+
+def load_database(db_path=None, **settings):
+    """
+    import ماژول database با یک config موقت؛ خروجی ماژول database است.
+    ماژول از روی مسیر فایل بارگذاری و با نام database ثبت می‌شود تا import database در ماژول‌های ربات همان را بگیرد.
+    """
+    install_config(db_path, **settings)
+    database = sys.modules.get("database")
+    if database is None:
+        spec = importlib.util.spec_from_file_location("database", module_path("database"))
+        database = importlib.util.module_from_spec(spec)
+        sys.modules["database"] = database
+        spec.loader.exec_module(database)
+    database.init_db()
+    return database
+
+def measure(func, repeat=20, warmup=2):
+    """اجرای func چند بار و برگرداندن زمان‌ها به میلی‌ثانیه"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def report(name, timings):
+    print(f"{name:<40} p50={percentile(timings, 0.5):8.3f}ms  p95={percentile(timings, 0.95):8.3f}ms"
+          f"  p99={percentile(timings, 0.99):8.3f}ms  mean={statistics.mean(timings):8.3f}ms")
@@ -0,0 +1,160 @@
+# benchmarks/fake_bot_api.py
+"""
+سرور محلی ساده که به جای api.telegram.org پاسخ می‌دهد تا بنچمارک‌ها بدون شبکه و بدون محدودیت تلگرام اجرا شوند.
+- هر متد با تأخیر latency (± jitter) ثانیه پاسخ می‌دهد تا اثر کندی Bot API هم دیده شود.
+- getChatMember با احتمال member_ratio وضعیت member و در غیر این صورت left برمی‌گرداند.
+- تعداد فراخوانی هر متد در calls شمرده می‌شود.
+- با max_rate بیش از max_rate درخواست در هر ثانیه مثل تلگرام با 429 و retry_after رد می‌شود (throttled).
+استفاده: با config.BOT_API_BASE_URL = server.base_url ربات به این سرور وصل می‌شود.
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+BOT_INFO = {"id": 1, "is_bot": True, "first_name": "BenchBot", "username": "bench_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+class FakeBotAPI:
+    def __init__(self, latency=0.05, jitter=0.0, member_ratio=1.0, host="127.0.0.1", port=0, seed=42,
+                 max_rate=None, retry_after=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.member_ratio = member_ratio
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.throttled = 0
+        self._recent = deque()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_ids = 0
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ---------- پاسخ متدها ----------
+    def _delay(self):
+        with self._lock:
+            return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def _next_message_id(self):
+        with self._lock:
+            self._message_ids += 1
+            return self._message_ids
+
+    def _is_member(self):
+        with self._lock:
+            return self._rng.random() < self.member_ratio
+
+    def _throttle(self):
+        """True اگر این درخواست از سقف max_rate در پنجره‌ی یک‌ثانیه‌ای بگذرد"""
+        if self.max_rate is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and self._recent[0] <= now - 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_rate:
+                self.throttled += 1
+                return True
+            self._recent.append(now)
+            return False
+
+    def handle(self, method, params):
+        with self._lock:
+            self.calls[method] += 1
+        name = method.lower()
+        if name == "getme":
+            return BOT_INFO
+        if name in ("sendmessage", "sendphoto", "senddocument", "editmessagetext", "copymessage", "forwardmessage"):
+            chat_id = _as_int(params.get("chat_id"), 0)
+            message = {
+                "message_id": _as_int(params.get("message_id"), 0) or self._next_message_id(),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_INFO,
+            }
+            if "text" in params:
+                message["text"] = params["text"]
+            return message
+        if name == "getchatmember":
+            user_id = _as_int(params.get("user_id"), 0)
+            return {
+                "status": "member" if self._is_member() else "left",
+                "user": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            }
+        if name == "getchat":
+            return {"id": _as_int(params.get("chat_id"), 0), "type": "channel", "title": "bench"}
+        if name == "getupdates":
+            return []
+        # بقیه‌ی متدها (answerCallbackQuery، setWebhook، deleteMessage و ...) فقط True برمی‌گردانند
+        return True
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                self._respond(_parse_body(self.headers.get("Content-Type", ""), body))
+
+            def do_GET(self):
+                self._respond({})
+
+            def _respond(self, params):
+                method = self.path.rstrip("/").rsplit("/", 1)[-1].split("?", 1)[0]
+                time.sleep(api._delay())
+                if api._throttle():
+                    status, body = 429, {"ok": False, "error_code": 429,
+                                         "description": f"Too Many Requests: retry after {api.retry_after}",
+                                         "parameters": {"retry_after": api.retry_after}}
+                else:
+                    status, body = 200, {"ok": True, "result": api.handle(method, params)}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def _parse_body(content_type, body):
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return dict(parse_qsl(body.decode()))
+    # multipart (ارسال فایل) برای بنچمارک لازم نیست؛ پارامترها نادیده گرفته می‌شوند
+    return {}
+
+def _as_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
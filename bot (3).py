@@ -1,9 +1,12 @@
-from flask import Flask, request
-from telegram import Update
+from flask import Flask, Response, request
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ConversationHandler
 import config
 import database
-import asyncio
+import metrics
+from instrumentation import InstrumentedRequest, instrument_application
+from outbound import OUTBOUND_GLOBAL_RATE, OUTBOUND_SCHEDULER_ENABLED, ScheduledRequest
+from persistence import PERSISTENCE_ENABLED, SQLitePersistence, register_persistence
+from webhook_pipeline import WEBHOOK_MODE, WEBHOOK_PROCESSES, create_pipeline
 
 # ثبت هندلرها
 from handlers.start import register_start_handler
@@ -19,6 +22,9 @@ from handlers.help import register_help_handler
 from handlers.admin_order_reply import register_admin_order_reply_handler
 from handlers.utils import send_main_menu, register_force_check_handler
 from handlers.forced_membership import register_forced_membership_handler  # 🔹 افزوده شد
+from broadcast import register_broadcast_handler
+from membership_audit import register_membership_audit_job
+from archive import register_archive_job
 
 app = Flask(__name__)
 
@@ -28,8 +34,32 @@ try:
 except AttributeError:
     print("خطا: تابع init_db پیدا نشد.")
 
+# بارگذاری همه‌ی تنظیمات در حافظه
+database.load_settings()
+
+# بافر نوشتن تأخیری شمارنده‌ها (اختیاری)
+if database.WRITE_BEHIND_ENABLED:
+    database.enable_write_behind()
+
 # ساخت اپلیکیشن تلگرام
-bot_app = ApplicationBuilder().token(config.BOT_TOKEN).build()
+builder = ApplicationBuilder().token(config.BOT_TOKEN)
+# زمان‌سنجی همه‌ی درخواست‌های خروجی Bot API
+api_request = InstrumentedRequest() if metrics.METRICS_ENABLED else None
+# محدودیت نرخ، تلاش مجدد پس از 429 و اولویت پاسخ کاربران؛ در حالت processes سهم نرخ سراسری بین پردازه‌ها تقسیم می‌شود
+# (با فرض یک worker در سرور WSGI که ProcessPipeline آن را با فایل قفل الزام می‌کند)
+if OUTBOUND_SCHEDULER_ENABLED:
+    processes = WEBHOOK_PROCESSES if WEBHOOK_MODE == "processes" else 1
+    api_request = ScheduledRequest(api_request, global_rate=OUTBOUND_GLOBAL_RATE / max(1, processes))
+if api_request is not None:
+    builder = builder.request(api_request)
+# ماندگاری user_data و وضعیت گفتگوها در دیتابیس (بین راه‌اندازی‌های مجدد)
+persistence = SQLitePersistence() if PERSISTENCE_ENABLED else None
+if persistence is not None:
+    builder = builder.persistence(persistence)
+# آدرس جایگزین Bot API (مثلاً سرور محلی بنچمارک یا Bot API server شخصی)
+if getattr(config, "BOT_API_BASE_URL", None):
+    builder = builder.base_url(config.BOT_API_BASE_URL)
+bot_app = builder.build()
 
 # ثبت هندلرهای ربات
 register_start_handler(bot_app)
@@ -45,6 +75,9 @@ register_help_handler(bot_app)
 register_admin_order_reply_handler(bot_app)
 register_force_check_handler(bot_app)
 register_forced_membership_handler(bot_app)  # 🔹 افزوده شد
+register_broadcast_handler(bot_app)
+register_membership_audit_job(bot_app)
+register_archive_job(bot_app)
 
 # لغو گفتگو به صورت سراسری
 async def global_cancel(update, context):
@@ -54,28 +87,33 @@ async def global_cancel(update, context):
 
 bot_app.add_handler(CommandHandler("cancel", global_cancel))
 
-@app.route(f"/{config.BOT_TOKEN}", methods=["POST"])
-def webhook():
-    update = Update.de_json(request.get_json(force=True), bot_app.bot)
-
-    async def handle():
-        if not getattr(bot_app, "_initialized", False):  # 🔹 بررسی مقداردهی اولیه
-            await bot_app.initialize()
-        await bot_app.process_update(update)
+# بارگذاری تنبل user_data و ماندگار کردن گفتگوها (پس از ثبت آخرین هندلر)
+if persistence is not None:
+    register_persistence(bot_app, persistence)
 
-    loop = asyncio.get_event_loop()
+# زمان‌سنجی هندلرها (پس از ثبت آخرین هندلر)
+if metrics.METRICS_ENABLED:
+    instrument_application(bot_app)
 
-    if loop.is_running():
-        asyncio.ensure_future(handle())
-    else:
-        loop.run_until_complete(handle())
+# صف آپدیت‌ها روی یک حلقه‌ی رویداد ماندگار یا پخش بین چند پردازه (در اولین درخواست راه‌اندازی می‌شود)
+pipeline = create_pipeline(bot_app)
 
+@app.route(f"/{config.BOT_TOKEN}", methods=["POST"])
+def webhook():
+    if not pipeline.submit(request.get_json(force=True)):
+        # صف پر است؛ تلگرام با دریافت خطا آپدیت را دوباره می‌فرستد
+        return "Busy", 503
     return "OK"
 
 @app.route('/')
 def home():
     return "ربات فعال است!"
 
+# متریک‌های همین پردازه (نه همه‌ی workerهای WSGI یا پردازه‌های حالت processes)
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     bot_app.run_webhook(
         listen="0.0.0.0",
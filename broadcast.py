@@ -0,0 +1,191 @@
+# broadcast.py
+import asyncio
+import os
+import socket
+import time
+import uuid
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+import config
+import database
+from outbound import background_requests
+from ratelimit import TokenBucket
+from webhook_pipeline import inline_mode_active
+
+# سقف کلی تلگرام حدود ۳۰ پیام در ثانیه است؛ کمی پایین‌تر می‌مانیم
+BROADCAST_RATE = getattr(config, "BROADCAST_RATE", 25)
+BROADCAST_BATCH_SIZE = getattr(config, "BROADCAST_BATCH_SIZE", 200)
+BROADCAST_CONCURRENCY = getattr(config, "BROADCAST_CONCURRENCY", 10)
+BROADCAST_MAX_RETRIES = getattr(config, "BROADCAST_MAX_RETRIES", 3)
+# مهلت اجاره‌ی هر ارسال (ثانیه)؛ پس از هر دسته تمدید می‌شود و باید از زمان ارسال یک دسته بیشتر باشد.
+# اگر پردازه‌ی مالک از کار بیفتد، پس از این مدت پردازه‌ی دیگری ارسال را ادامه می‌دهد.
+BROADCAST_LEASE_SECONDS = getattr(config, "BROADCAST_LEASE_SECONDS", 300)
+# فاصله‌ی بررسی ارسال‌های نیمه‌تمام بی‌مالک (ثانیه)
+BROADCAST_RESUME_INTERVAL = getattr(config, "BROADCAST_RESUME_INTERVAL", 60)
+
+# ارسال‌های در حال اجرا در این پردازه: broadcast_id -> task
+_running = {}
+
+def retry_after_seconds(error):
+    """مدت انتظار خطای RetryAfter به ثانیه (در نسخه‌های جدید PTB ممکن است timedelta باشد)"""
+    delay = error.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+class BroadcastStats:
+    """آمار یک اجرای ارسال همگانی (فقط همین اجرا، نه اجراهای قبل از راه‌اندازی مجدد)"""
+
+    def __init__(self, broadcast_id):
+        self.broadcast_id = broadcast_id
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def throughput(self):
+        """تعداد پیام پردازش‌شده در ثانیه"""
+        return (self.sent + self.failed) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"📣 پیام همگانی #{self.broadcast_id}\n"
+            f"✅ ارسال‌شده: {self.sent}\n"
+            f"❌ ناموفق: {self.failed}\n"
+            f"🔁 تلاش مجدد: {self.retries}\n"
+            f"⏱ {self.elapsed:.0f} ثانیه ({self.throughput:.1f} پیام در ثانیه)"
+        )
+
+async def _send_one(bot, bucket, user_id, text, stats):
+    for attempt in range(BROADCAST_MAX_RETRIES + 1):
+        await bucket.acquire()
+        try:
+            await bot.send_message(chat_id=user_id, text=text)
+            return True
+        except RetryAfter as e:
+            # محدودیت سراسری است؛ همه‌ی ارسال‌ها تا پایان مهلت متوقف می‌شوند
+            stats.retries += 1
+            bucket.pause(retry_after_seconds(e))
+        except (Forbidden, BadRequest):
+            # کاربر ربات را مسدود کرده یا چت وجود ندارد؛ تلاش مجدد فایده‌ای ندارد
+            return False
+        except TelegramError:
+            stats.retries += 1
+            await asyncio.sleep(2 ** attempt)
+    return False
+
+async def run_broadcast(bot, broadcast_id, rate=BROADCAST_RATE, batch_size=BROADCAST_BATCH_SIZE,
+                        concurrency=BROADCAST_CONCURRENCY, on_progress=None):
+    """
+    ارسال پیام همگانی به همه‌ی کاربران مسدودنشده.
+    - شناسه‌ی کاربران دسته به دسته با صفحه‌بندی کلیدی خوانده می‌شود (نه کل جدول users).
+    - ارسال‌ها از یک سطل توکن با نرخ rate عبور می‌کنند و RetryAfter همه را موقتاً متوقف می‌کند.
+    - پس از هر دسته پیشرفت در جدول broadcasts ذخیره می‌شود تا پس از راه‌اندازی مجدد از همان‌جا ادامه یابد.
+    - پیش از ارسال اجاره‌ی پیام گرفته می‌شود (claim_broadcast) تا از چند پردازه یا worker فقط یکی ارسال کند؛
+      اجاره پس از هر دسته تمدید می‌شود و اگر از دست برود ارسال متوقف می‌شود.
+    bot فقط باید متد send_message داشته باشد. خروجی BroadcastStats است
+    (یا None اگر ارسالی در جریان نباشد یا پردازه‌ی دیگری آن را ارسال کند).
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    if not await database.aio.claim_broadcast(broadcast_id, owner, BROADCAST_LEASE_SECONDS):
+        return None
+    finished = False
+    try:
+        stats = await _run_claimed_broadcast(bot, broadcast_id, owner, rate, batch_size, concurrency, on_progress)
+        finished = stats is not None
+        return stats
+    finally:
+        if not finished:
+            # لغو یا خطا: اجاره آزاد می‌شود تا پردازه‌ی دیگری بدون انتظار ادامه دهد
+            await database.aio.release_broadcast(broadcast_id, owner)
+
+async def _run_claimed_broadcast(bot, broadcast_id, owner, rate, batch_size, concurrency, on_progress):
+    broadcast = await database.aio.get_broadcast(broadcast_id)
+    if broadcast is None or broadcast["status"] != "running":
+        return None
+
+    stats = BroadcastStats(broadcast_id)
+    bucket = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    text = broadcast["message"]
+    last_user_id = broadcast["last_user_id"]
+
+    async def send(user_id):
+        async with semaphore:
+            return await _send_one(bot, bucket, user_id, text, stats)
+
+    while True:
+        user_ids = await database.aio.get_user_ids_batch(last_user_id, batch_size)
+        if not user_ids:
+            break
+        results = await asyncio.gather(*(send(user_id) for user_id in user_ids))
+        sent = sum(results)
+        failed = len(results) - sent
+        stats.sent += sent
+        stats.failed += failed
+        last_user_id = user_ids[-1]
+        if not await database.aio.update_broadcast_progress(broadcast_id, last_user_id, sent, failed,
+                                                            owner=owner, lease_seconds=BROADCAST_LEASE_SECONDS):
+            print(f"Broadcast {broadcast_id}: lease lost, another process continues it")
+            return None
+        if on_progress is not None:
+            await on_progress(stats)
+
+    await database.aio.finish_broadcast(broadcast_id)
+    return stats
+
+def start_broadcast(application, broadcast_id, notify_chat_id=None):
+    """
+    اجرای ارسال همگانی در پس‌زمینه؛ در پایان خلاصه‌ی آمار برای notify_chat_id فرستاده می‌شود.
+    در حالت inline وب‌هوک task فقط هنگام پردازش آپدیت‌ها جلو می‌رود؛ آنجا broadcast_command به جای آن
+    ارسال را برای maintenance.py ثبت می‌کند.
+    """
+    if broadcast_id in _running:
+        return _running[broadcast_id]
+
+    async def job():
+        try:
+            # پیام‌های همگانی پشت پاسخ‌های کاربران در صف زمان‌بند خروجی می‌مانند
+            with background_requests():
+                stats = await run_broadcast(application.bot, broadcast_id)
+        finally:
+            _running.pop(broadcast_id, None)
+        if stats is not None and notify_chat_id is not None:
+            await application.bot.send_message(chat_id=notify_chat_id, text=stats.summary())
+
+    task = application.create_task(job())
+    _running[broadcast_id] = task
+    return task
+
+async def broadcast_command(update, context):
+    """/broadcast متن پیام — ارسال پیام به همه‌ی کاربران (فقط مدیر)"""
+    text = update.message.text.partition(" ")[2].strip()
+    if not text:
+        await update.message.reply_text("❗ استفاده: /broadcast متن پیام")
+        return
+    broadcast_id = await database.aio.create_broadcast(update.effective_user.id, text)
+    if inline_mode_active():
+        # ارسال در پس‌زمینه در این میزبان بین آپدیت‌ها متوقف می‌ماند؛ maintenance.py پیام‌های ثبت‌شده را می‌فرستد
+        await update.message.reply_text(
+            f"📣 پیام همگانی #{broadcast_id} ثبت شد.\n"
+            "در این میزبان ارسال در پس‌زمینه ممکن نیست؛ پیام در اجرای بعدی maintenance.py "
+            "(Scheduled task) ارسال و خلاصه‌ی آن برای شما فرستاده می‌شود."
+        )
+        return
+    await update.message.reply_text(f"📣 ارسال پیام همگانی #{broadcast_id} شروع شد.")
+    start_broadcast(context.application, broadcast_id, notify_chat_id=update.effective_chat.id)
+
+async def resume_broadcasts_job(context):
+    """ادامه‌ی ارسال‌های نیمه‌تمام پس از راه‌اندازی مجدد یا از کار افتادن پردازه‌ی مالک (پس از پایان اجاره)"""
+    for broadcast in await database.aio.get_running_broadcasts():
+        start_broadcast(context.application, broadcast["broadcast_id"], notify_chat_id=broadcast["admin_id"])
+
+def register_broadcast_handler(app):
+    """ثبت دستور /broadcast برای مدیر و ادامه‌ی خودکار ارسال‌های نیمه‌تمام"""
+    from telegram.ext import CommandHandler, filters
+    app.add_handler(CommandHandler("broadcast", broadcast_command, filters=filters.User(user_id=database.get_admin_id())))
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(resume_broadcasts_job, interval=BROADCAST_RESUME_INTERVAL, first=5,
+                                    name="resume_broadcasts")
@@ -1,21 +1,164 @@
+import asyncio
+import atexit
+import contextlib
+import datetime
+import functools
+import itertools
+import os
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import config
+from cache import TTLCache
+import metrics
+from rows import JoinedChannelRow, ROW_CLASSES, SubscriberOrderRow
+
+# تنظیمات اتصال (در صورت نبود در config مقدار پیش‌فرض استفاده می‌شود)
+DB_BUSY_TIMEOUT_MS = getattr(config, "DB_BUSY_TIMEOUT_MS", 5000)
+DB_MMAP_SIZE = getattr(config, "DB_MMAP_SIZE", 64 * 1024 * 1024)
+DB_READ_WORKERS = getattr(config, "DB_READ_WORKERS", 4)
+# حداکثر فاصله‌ی (ثانیه) بررسی نسخه‌ی تنظیمات برای دیدن تغییرات پردازه‌های دیگر
+SETTINGS_VERSION_CHECK_INTERVAL = getattr(config, "SETTINGS_VERSION_CHECK_INTERVAL", 2.0)
+# حداکثر تعداد جفت ارجاع ثبت‌شده که در حافظه نگه داشته می‌شود
+REFERRAL_CACHE_SIZE = getattr(config, "REFERRAL_CACHE_SIZE", 100000)
+# اندازه‌ی هر صفحه در توابع iter_*
+DB_PAGE_SIZE = getattr(config, "DB_PAGE_SIZE", 500)
+# بافر نوشتن تأخیری شمارنده‌ها؛ با enable_write_behind فعال می‌شود
+WRITE_BEHIND_ENABLED = getattr(config, "WRITE_BEHIND_ENABLED", False)
+WRITE_BEHIND_FLUSH_INTERVAL = getattr(config, "WRITE_BEHIND_FLUSH_INTERVAL", 0.05)
+WRITE_BEHIND_MAX_PENDING = getattr(config, "WRITE_BEHIND_MAX_PENDING", 500)
+# حداکثر عمر (ثانیه) نسخه‌ی حافظه‌ی کانال‌های اجباری؛ برای دیدن تغییرات پردازه‌های دیگر
+FORCED_CHANNELS_REFRESH_INTERVAL = getattr(config, "FORCED_CHANNELS_REFRESH_INTERVAL", 30)
+
+def order_score_sql(current="current"):
+    """
+    بخش ثابت وزن سفارش در get_weighted_orders.
+    وزن = (100 * current / required) * 3 + (now - created_at) / 3600 * 2 + (required - current)
+    جمله‌ی now برای همه‌ی سفارش‌ها یکسان است، پس ترتیب وزن با ترتیب همین امتیاز برابر است
+    و امتیاز را می‌توان در ستون priority_score ذخیره و ایندکس کرد.
+    """
+    return (f"(100.0 * ({current}) / required) * 3"
+            f" - strftime('%s', created_at) / 3600.0 * 2"
+            f" + (required - ({current}))")
+
+# عدد تصادفی یکنواخت در بازه‌ی [0, 1) برای ستون rand_key سفارش‌ها
+RANDOM_KEY_SQL = "((random() & 9007199254740991) / 9007199254740992.0)"
+
+# شرط مشترک فیدهای جمع‌آوری سکه: سفارش باز، متعلق به دیگران و کانالی که جمع‌کننده قبلاً در آن عضو نشده است
+# (عضویت‌های بایگانی‌شده هم حساب می‌شوند). هر دو NOT EXISTS از ایندکس یکتای (user_id, channel_username, ...) استفاده می‌کنند.
+# پارامترها: (collector_id, collector_id, collector_id)
+COLLECTOR_FEED_FILTER = """
+    user_id != ? AND current < required
+    AND NOT EXISTS (
+        SELECT 1 FROM joined_channels AS j
+        WHERE j.user_id = ? AND j.channel_username = subscriber_orders.channel_username
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM joined_channels_archive AS a
+        WHERE a.user_id = ? AND a.channel_username = subscriber_orders.channel_username
+    )
+"""
 
 def dict_factory(cursor, row):
-    """تبدیل هر ردیف نتیجه به دیکشنری"""
+    """تبدیل هر ردیف نتیجه به دیکشنری (مسیرهای پرتکرار به جای آن از کلاس‌های rows.py استفاده می‌کنند)"""
     return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
 
+# ==================== مدیریت اتصال‌ها ====================
+_local = threading.local()
+
+# شمارنده‌های سبک برای بنچمارک و پایش (مثلاً تعداد commit در هر آپدیت)
+db_stats = {"commits": 0}
+_db_stats_lock = threading.Lock()
+metrics.GaugeFunction("tbot_db_commits_total", "SQLite commits", lambda: db_stats["commits"], "counter")
+
+class PooledConnection(sqlite3.Connection):
+    """
+    اتصالی که برای هر رشته یک بار باز می‌شود و با close بسته نمی‌شود؛
+    فقط تراکنش نیمه‌کاره (در صورت وجود) لغو می‌شود تا فراخوانی بعدی از وضعیت تمیز شروع کند.
+    """
+
+    def cursor(self, factory=None):
+        # فقط cursorهای نمونه‌برداری‌شده زمان‌سنجی می‌شوند؛ بقیه همان cursor سریع C هستند
+        if factory is None:
+            factory = metrics.TimedCursor if metrics.should_sample(metrics.QUERY_SAMPLE_RATE) else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        super().commit()
+        with _db_stats_lock:
+            db_stats["commits"] += 1
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def close_for_real(self):
+        super().close()
+
+def _open_connection():
+    """باز کردن اتصال جدید و اعمال تنظیمات PRAGMA فقط یک بار"""
+    conn = sqlite3.connect(
+        config.DATABASE_NAME,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        factory=PooledConnection,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+    return conn
+
+# اتصال‌هایی که پس از fork از پردازه‌ی والد به ارث رسیده‌اند؛ در فرزند نه استفاده و نه بسته می‌شوند
+# (بستن آن‌ها ممکن است فایل WAL والد را checkpoint یا حذف کند)
+_inherited_connections = []
+
 def get_connection():
-    """ایجاد اتصال به دیتابیس"""
-    conn = sqlite3.connect(config.DATABASE_NAME)
+    """
+    دریافت اتصال دیتابیس مخصوص رشته‌ی جاری (در اولین استفاده و در هر پردازه‌ی جدید ساخته می‌شود).
+    تابعی که پس از نوشتن و پیش از close با خطا خارج شده باشد تراکنش نیمه‌کاره‌ای روی اتصال مشترک جا می‌گذارد؛
+    آن تراکنش این‌جا لغو می‌شود تا commit تابع بعدی آن را ثبت نکند (مثل اتصال‌های جداگانه‌ی قبلی).
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid != os.getpid():
+        _inherited_connections.append(conn)
+        conn = None
+    if conn is None:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    elif conn.in_transaction:
+        conn.rollback()
     conn.row_factory = dict_factory
     return conn
 
-def init_db():
-    """ایجاد تمام جداول مورد نیاز در دیتابیس"""
-    conn = get_connection()
-    cur = conn.cursor()
+def close_connection():
+    """بستن واقعی اتصال رشته‌ی جاری؛ مثلاً هنگام خاموش شدن برنامه"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close_for_real()
+
+# ==================== مهاجرت‌های دیتابیس ====================
+def _add_column_if_missing(cur, table, column, definition):
+    """افزودن ستون در صورت نبود؛ True یعنی ستون همین حالا اضافه شد"""
+    cur.execute(f"PRAGMA table_info({table})")
+    if any(row["name"] == column for row in cur.fetchall()):
+        return False
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    return True
 
+def _get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()["user_version"]
+
+def _migration_base_tables(cur):
+    """نسخه‌ی ۱: ایجاد جداول اصلی (برای دیتابیس‌های قدیمی بدون user_version هم بی‌خطر است)"""
     # ایجاد جدول users
     cur.execute(f"""
         CREATE TABLE IF NOT EXISTS users (
@@ -28,10 +171,7 @@ def init_db():
             registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
     """)
-    try:
-        cur.execute("ALTER TABLE users ADD COLUMN coin_fraction REAL DEFAULT 0;")
-    except sqlite3.OperationalError:
-        pass
+    _add_column_if_missing(cur, "users", "coin_fraction", "REAL DEFAULT 0")
 
     # ایجاد جدول channels
     cur.execute("""
@@ -124,11 +264,297 @@ def init_db():
         );
     """)
 
-    conn.commit()
-    conn.close()
+def _migration_order_ranking(cur):
+    """نسخه‌ی ۲: ستون‌های امتیاز و کلید تصادفی سفارش‌ها و ایندکس‌های جزئی سفارش‌های باز"""
+    if _add_column_if_missing(cur, "subscriber_orders", "priority_score", "REAL"):
+        cur.execute(f"UPDATE subscriber_orders SET priority_score = {order_score_sql()};")
+    if _add_column_if_missing(cur, "subscriber_orders", "rand_key", "REAL"):
+        cur.execute(f"UPDATE subscriber_orders SET rand_key = {RANDOM_KEY_SQL};")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_subscriber_orders_open_random
+        ON subscriber_orders (rand_key)
+        WHERE current < required;
+    """)
+    # ایندکس جزئی فقط روی سفارش‌های باز، مرتب بر اساس امتیاز
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_subscriber_orders_open_priority
+        ON subscriber_orders (priority_score DESC)
+        WHERE current < required;
+    """)
+
+def _migration_hot_query_indexes(cur):
+    """نسخه‌ی ۳: ایندکس‌های کوئری‌های پرتکرار"""
+    # get_recent_orders و get_ending_orders
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_subscriber_orders_open_created
+        ON subscriber_orders (created_at DESC)
+        WHERE current < required;
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_subscriber_orders_open_progress
+        ON subscriber_orders ((current * 1.0 / required) DESC)
+        WHERE current < required;
+    """)
+    # get_available_coin_orders و has_active_order
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_subscriber_orders_open_owner
+        ON subscriber_orders (user_id, channel_username)
+        WHERE current < required;
+    """)
+    # user_has_joined_channel و فیلتر فیدها از ایندکس یکتای (user_id, channel_username, join_type) استفاده می‌کنند
+    # و get_user_channels از ایندکس یکتای (owner_id, channel_username) جدول channels.
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_coin_orders_status ON coin_orders (status, created_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_coin_orders_user ON coin_orders (user_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date);")
+
+def _migration_broadcasts(cur):
+    """نسخه‌ی ۴: جدول پیام‌های همگانی و پیشرفت ارسال آن‌ها"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            broadcast_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER,
+            message TEXT,
+            status TEXT DEFAULT 'running',
+            last_user_id INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+    """)
+
+def _migration_users_search(cur):
+    """
+    نسخه‌ی ۵: ایندکس جستجوی زیررشته روی تلفن و شناسه‌ی کاربر (FTS5 با توکنایزر trigram)
+    که با تریگرها همگام با جدول users می‌ماند. اگر SQLite از FTS5/trigram پشتیبانی نکند
+    (نسخه‌ی قدیمی‌تر از 3.34)، جدول ساخته نمی‌شود و search_users از LIKE استفاده می‌کند.
+    """
+    try:
+        cur.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5(
+                user_id, phone, content='users', content_rowid='user_id', tokenize='trigram'
+            );
+        """)
+    except sqlite3.OperationalError as e:
+        print("Users search index not available:", e)
+        return
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_search_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_search (rowid, user_id, phone) VALUES (new.user_id, new.user_id, new.phone);
+        END;
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_search_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_search (users_search, rowid, user_id, phone)
+            VALUES ('delete', old.user_id, old.user_id, old.phone);
+        END;
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_search_update AFTER UPDATE OF user_id, phone ON users BEGIN
+            INSERT INTO users_search (users_search, rowid, user_id, phone)
+            VALUES ('delete', old.user_id, old.user_id, old.phone);
+            INSERT INTO users_search (rowid, user_id, phone) VALUES (new.user_id, new.user_id, new.phone);
+        END;
+    """)
+    cur.execute("INSERT INTO users_search (users_search) VALUES ('rebuild');")
+
+def _migration_membership_audit(cur):
+    """نسخه‌ی ۶: ثبت کاربرانی که پس از دریافت سکه از کانال خارج شده‌اند"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS membership_violations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            channel_username TEXT,
+            order_id INTEGER,
+            penalty REAL,
+            joined_at TIMESTAMP,
+            detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_membership_violations_user ON membership_violations (user_id);")
+
+def _migration_persistence(cur):
+    """نسخه‌ی ۷: وضعیت ماندگار user_data و ConversationHandlerها (persistence.py)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS persisted_user_data (
+            user_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS persisted_conversations (
+            name TEXT NOT NULL,
+            conversation_key TEXT NOT NULL,
+            state BLOB NOT NULL,
+            PRIMARY KEY (name, conversation_key)
+        ) WITHOUT ROWID;
+    """)
+
+def _migration_archive(cur):
+    """
+    نسخه‌ی ۸: جدول‌های بایگانی (archive_batch) برای سفارش‌های تکمیل‌شده، عضویت‌ها، تراکنش‌ها و خریدهای سکه‌ی قدیمی،
+    و ایندکس‌های جزئی که ردیف‌های قابل بایگانی را بدون پیمایش کل جدول پیدا می‌کنند.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS subscriber_orders_archive (
+            order_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            channel_username TEXT,
+            required INTEGER,
+            current INTEGER,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_subscriber_orders_archive_user ON subscriber_orders_archive (user_id);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS joined_channels_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            channel_username TEXT,
+            join_type TEXT,
+            order_id INTEGER,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, channel_username, join_type)
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS coin_orders_archive (
+            order_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            quantity INTEGER,
+            price REAL,
+            receipt_file_id TEXT,
+            status TEXT,
+            created_at TIMESTAMP,
+            admin_id INTEGER,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_coin_orders_archive_user ON coin_orders_archive (user_id);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS transactions_archive (
+            id INTEGER PRIMARY KEY,
+            type TEXT,
+            amount REAL,
+            date TIMESTAMP,
+            description TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_archive_date ON transactions_archive (date);")
+    # سفارش‌های تکمیل‌شده و خریدهای بررسی‌شده به ترتیب زمان ثبت (transactions از idx_transactions_date
+    # و joined_channels از ترتیب id استفاده می‌کنند)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_subscriber_orders_completed
+        ON subscriber_orders (created_at)
+        WHERE current >= required;
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_coin_orders_settled
+        ON coin_orders (created_at)
+        WHERE status != 'pending';
+    """)
+
+def _migration_broadcast_lease(cur):
+    """نسخه‌ی ۹: مالک و مهلت اجاره‌ی هر پیام همگانی تا فقط یک پردازه آن را ارسال کند (claim_broadcast)"""
+    _add_column_if_missing(cur, "broadcasts", "owner", "TEXT")
+    _add_column_if_missing(cur, "broadcasts", "lease_until", "TIMESTAMP")
+
+def _migration_join_left_at(cur):
+    """
+    نسخه‌ی ۱۰: زمان خروج کاربر از کانال پس از دریافت سکه (apply_leaver_penalties).
+    ردیف عضویت حذف نمی‌شود تا قید یکتا و فیلتر فیدها جلوی پاداش دوباره‌ی همان کانال را بگیرند.
+    """
+    _add_column_if_missing(cur, "joined_channels", "left_at", "TIMESTAMP")
+    _add_column_if_missing(cur, "joined_channels_archive", "left_at", "TIMESTAMP")
+
+def _migration_job_checkpoints(cur):
+    """
+    نسخه‌ی ۱۱: نقطه‌ی ادامه‌ی jobهای دسته‌ای (مثل بازرسی عضویت) در جدول جداگانه؛
+    ذخیره‌ی آن در settings با هر دسته نسخه‌ی تنظیمات را بالا می‌برد و همه‌ی پردازه‌ها تنظیمات را دوباره می‌خواندند.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS job_checkpoints (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("""
+        INSERT OR IGNORE INTO job_checkpoints (name, value)
+        SELECT 'membership_audit', CAST(value AS INTEGER) FROM settings WHERE key = 'membership_audit_last_id'
+    """)
+    cur.execute("DELETE FROM settings WHERE key = 'membership_audit_last_id'")
+
+# مهاجرت‌ها به ترتیب؛ شماره‌ی هر مهاجرت (از ۱) در PRAGMA user_version ذخیره می‌شود.
+# مهاجرت‌های قبلی هرگز تغییر نمی‌کنند؛ تغییر جدید = تابع جدید در انتهای لیست.
+MIGRATIONS = [
+    _migration_base_tables,
+    _migration_order_ranking,
+    _migration_hot_query_indexes,
+    _migration_broadcasts,
+    _migration_users_search,
+    _migration_membership_audit,
+    _migration_persistence,
+    _migration_archive,
+    _migration_broadcast_lease,
+    _migration_join_left_at,
+    _migration_job_checkpoints,
+]
+
+def init_db():
+    """اجرای مهاجرت‌های اعمال‌نشده؛ اگر نسخه‌ی دیتابیس به‌روز باشد هیچ کاری انجام نمی‌شود"""
+    conn = get_connection()
+    if _get_schema_version(conn) >= len(MIGRATIONS):
+        conn.close()
+        return
+
+    # قفل نوشتن از ابتدا گرفته می‌شود تا دو پردازه همزمان یک مهاجرت را اجرا نکنند
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cur = conn.cursor()
+        version = _get_schema_version(conn)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(cur)
+            cur.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    finally:
+        conn.close()
+
+# ==================== خواندن صفحه به صفحه (keyset) ====================
+def iter_keyset(table, key, where="1", params=(), batch_size=DB_PAGE_SIZE):
+    """
+    خواندن ردیف‌های table به ترتیب key (کلید اصلی) به صورت صفحه به صفحه و برگرداندن یکی یکی.
+    هر صفحه با یک کوئری مستقل (key > آخرین مقدار) و fetchall خوانده می‌شود،
+    پس بین صفحه‌ها هیچ cursor یا تراکنش خواندنی باز نمی‌ماند و کل جدول در حافظه جمع نمی‌شود.
+    ردیف جدول‌های پرتکرار به شکل کلاس‌های فشرده‌ی rows.py برگردانده می‌شود.
+    """
+    row_class = ROW_CLASSES.get(table)
+    last_key = None
+    while True:
+        conn = get_connection()
+        cur = conn.cursor()
+        if row_class is not None:
+            cur.row_factory = row_class
+        if last_key is None:
+            cur.execute(f"SELECT * FROM {table} WHERE {where} ORDER BY {key} LIMIT ?",
+                        (*params, batch_size))
+        else:
+            cur.execute(f"SELECT * FROM {table} WHERE ({where}) AND {key} > ? ORDER BY {key} LIMIT ?",
+                        (*params, last_key, batch_size))
+        rows = cur.fetchall()
+        conn.close()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_key = rows[-1][key]
 
 # ==================== مدیریت کاربران ====================
 def get_user(user_id):
+    # dict معمولی (نه rows.UserRow): هندلرها ردیف کاربر را تغییر می‌دهند یا به JSON تبدیل می‌کنند
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
@@ -198,7 +624,25 @@ def update_user_fraction(user_id, new_fraction):
     conn.commit()
     conn.close()
 
+def get_user_ids_batch(after_user_id=0, limit=500, include_banned=False):
+    """
+    شناسه‌ی کاربران به ترتیب user_id و بعد از after_user_id (صفحه‌بندی کلیدی روی کلید اصلی)؛
+    کاربران مسدود (banned=1) به طور پیش‌فرض حذف می‌شوند.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT user_id FROM users
+        WHERE user_id > ? {"" if include_banned else "AND banned = 0"}
+        ORDER BY user_id
+        LIMIT ?
+    """, (after_user_id, limit))
+    user_ids = [row["user_id"] for row in cur.fetchall()]
+    conn.close()
+    return user_ids
+
 def get_all_users():
+    """همه‌ی کاربران به شکل dict؛ برای پیمایش بدون جمع شدن کل جدول در حافظه iter_all_users"""
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("SELECT * FROM users")
@@ -206,15 +650,59 @@ def get_all_users():
     conn.close()
     return users
 
-def search_users(query):
+def iter_all_users(batch_size=DB_PAGE_SIZE):
+    """نسخه‌ی جریانی get_all_users"""
+    return iter_keyset("users", "user_id", batch_size=batch_size)
+
+def get_users_page(after_user_id=0, limit=50):
+    """یک صفحه از کاربران بعد از after_user_id (به شکل dict)؛ برای فهرست صفحه‌بندی‌شده‌ی مدیر"""
+    return [row.copy() for row in itertools.islice(
+        iter_keyset("users", "user_id", "user_id > ?", (after_user_id,), batch_size=limit), limit
+    )]
+
+_users_search_available = None
+
+def _has_users_search_index():
+    global _users_search_available
+    if _users_search_available is None:
+        conn = get_connection()
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'users_search'").fetchone()
+        conn.close()
+        _users_search_available = row is not None
+    return _users_search_available
+
+def _users_search_condition(query):
+    """
+    شرط WHERE جستجوی زیررشته در تلفن یا شناسه‌ی کاربر و پارامترهای آن.
+    trigram فقط برای عبارت‌های سه‌حرفی و بیشتر کار می‌کند؛ عبارت کوتاه‌تر با LIKE جستجو می‌شود.
+    """
+    query = str(query).strip()
+    if len(query) >= 3 and _has_users_search_index():
+        match = '"' + query.replace('"', '""') + '"'
+        return "user_id IN (SELECT rowid FROM users_search WHERE users_search MATCH ?)", (match,)
+    return "phone LIKE ? OR CAST(user_id AS TEXT) LIKE ?", (f"%{query}%", f"%{query}%")
+
+def search_users(query, limit=50):
+    """جستجوی کاربران با زیررشته‌ی تلفن یا شناسه؛ تطابق کامل اول و بعد به ترتیب user_id"""
+    query = str(query).strip()
+    where, params = _users_search_condition(query)
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE phone LIKE ? OR CAST(user_id AS TEXT) LIKE ?",
-                (f"%{query}%", f"%{query}%"))
+    cur.execute(f"""
+        SELECT * FROM users
+        WHERE {where}
+        ORDER BY (phone = ? OR CAST(user_id AS TEXT) = ?) DESC, user_id
+        LIMIT ?
+    """, (*params, query, query, limit))
     users = cur.fetchall()
     conn.close()
     return users
 
+def iter_search_users(query, batch_size=DB_PAGE_SIZE):
+    """نسخه‌ی جریانی search_users"""
+    where, params = _users_search_condition(query)
+    return iter_keyset("users", "user_id", where, params, batch_size=batch_size)
+
 def ban_user(user_id):
     conn = get_connection()
     cur = conn.cursor()
@@ -230,6 +718,9 @@ def unban_user(user_id):
     conn.close()
 
 def update_user_warnings(user_id, delta):
+    if _write_behind is not None:
+        _write_behind.add_warnings(user_id, delta)
+        return
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("UPDATE users SET warnings = warnings + ? WHERE user_id = ?", (delta, user_id))
@@ -237,28 +728,33 @@ def update_user_warnings(user_id, delta):
     conn.close()
 
 def get_user_warnings(user_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT warnings FROM users WHERE user_id = ?", (user_id,))
-    result = cur.fetchone()
-    conn.close()
+    buffer = _write_behind
+    # اخطارهایی که هنوز در بافر نوشتن تأخیری هستند هم حساب می‌شوند؛ خواندن دیتابیس و بافر
+    # بین commit یک flush و پاک شدن تغییرات آن از بافر انجام نمی‌شود (نه دوبار شمرده می‌شوند و نه گم می‌شوند)
+    with buffer.consistent_read() if buffer is not None else contextlib.nullcontext():
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT warnings FROM users WHERE user_id = ?", (user_id,))
+        result = cur.fetchone()
+        conn.close()
+        pending = buffer.pending_warnings(user_id) if buffer is not None else 0
     if result:
-        return result.get("warnings", 0)
+        return result.get("warnings", 0) + pending
     return 0
 
 def get_weighted_orders(collector_id, limit=30):
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("""
+    cur.row_factory = SubscriberOrderRow
+    # مرتب‌سازی روی priority_score ایندکس‌شده همان ترتیب وزن را می‌دهد (order_score_sql)
+    cur.execute(f"""
         SELECT *,
-            ((100.0 * current / required) * 3 +
-             (strftime('%s','now') - strftime('%s', created_at)) / 3600.0 * 2 +
-             (required - current) * 1) AS weight
+            priority_score + strftime('%s','now') / 3600.0 * 2 AS weight
         FROM subscriber_orders
-        WHERE user_id != ? AND current < required
-        ORDER BY weight DESC
+        WHERE {COLLECTOR_FEED_FILTER}
+        ORDER BY priority_score DESC
         LIMIT ?
-    """, (collector_id, limit))
+    """, (collector_id, collector_id, collector_id, limit))
     rows = cur.fetchall()
     conn.close()
     return rows
@@ -269,7 +765,11 @@ def user_has_joined_channel(user_id, channel_username):
     cur.execute("""
         SELECT 1 FROM joined_channels
         WHERE user_id = ? AND channel_username = ?
-    """, (user_id, channel_username))
+        UNION ALL
+        SELECT 1 FROM joined_channels_archive
+        WHERE user_id = ? AND channel_username = ?
+        LIMIT 1
+    """, (user_id, channel_username, user_id, channel_username))
     result = cur.fetchone()
     conn.close()
     return result is not None
@@ -307,6 +807,11 @@ def create_subscriber_order(user_id, channel_username, required):
     cur.execute("INSERT INTO subscriber_orders (user_id, channel_username, required) VALUES (?, ?, ?)",
                 (user_id, channel_username, required))
     order_id = cur.lastrowid
+    cur.execute(f"""
+        UPDATE subscriber_orders
+        SET priority_score = {order_score_sql()}, rand_key = {RANDOM_KEY_SQL}
+        WHERE order_id = ?
+    """, (order_id,))
     conn.commit()
     conn.close()
     return order_id
@@ -314,6 +819,7 @@ def create_subscriber_order(user_id, channel_username, required):
 def get_available_coin_orders(user_id):
     conn = get_connection()
     cur = conn.cursor()
+    cur.row_factory = SubscriberOrderRow
     cur.execute("SELECT * FROM subscriber_orders WHERE user_id = ? AND current < required",
                 (user_id,))
     orders = cur.fetchall()
@@ -321,10 +827,20 @@ def get_available_coin_orders(user_id):
     return orders
 
 def update_order_current(order_id):
+    """
+    افزایش current سفارش به شرط پر نبودن آن.
+    این افزایش عمداً از بافر نوشتن تأخیری عبور نمی‌کند: ظرفیت سفارش را فیدها و has_active_order همه‌ی
+    پردازه‌ها از دیتابیس می‌خوانند و افزایش‌های در انتظار یک پردازه را نمی‌بینند.
+    """
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("UPDATE subscriber_orders SET current = current + 1 WHERE order_id = ?",
-                (order_id,))
+    cur.execute(f"""
+        UPDATE subscriber_orders
+        SET current = current + 1,
+            priority_score = {order_score_sql("current + 1")},
+            rand_key = {RANDOM_KEY_SQL}
+        WHERE order_id = ? AND current < required
+    """, (order_id,))
     conn.commit()
     conn.close()
 
@@ -339,15 +855,140 @@ def has_active_order(user_id, channel_username):
     conn.close()
     return exists
 
+def credit_collector(user_id, order_id, channel_username, reward, join_type="order",
+                     tx_type="join_reward", description=""):
+    """
+    ثبت کامل یک عضویت موفق برای جمع‌کننده در یک تراکنش و با یک commit:
+      - ثبت در joined_channels
+      - افزایش current سفارش فقط در صورتی که current < required باشد (سفارش بیش از ظرفیت پر نمی‌شود)
+      - افزودن پاداش: بخش صحیح به coin_balance و باقیمانده به coin_fraction
+      - ثبت در transactions
+    اگر این عضویت قبلاً ثبت (یا بایگانی) شده یا سفارش پر شده باشد هیچ تغییری اعمال نمی‌شود و False برمی‌گردد.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    # قفل نوشتن از ابتدا گرفته می‌شود تا بررسی ظرفیت و افزایش current بین دو پردازه جابه‌جا نشود
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # قید یکتای joined_channels عضویت‌های بایگانی‌شده را نمی‌بیند
+        cur.execute("""
+            SELECT 1 FROM joined_channels_archive
+            WHERE user_id = ? AND channel_username = ? AND join_type = ?
+        """, (user_id, channel_username, join_type))
+        if cur.fetchone() is not None:
+            return False
+        cur.execute("""
+            INSERT OR IGNORE INTO joined_channels (user_id, channel_username, join_type, order_id)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, channel_username, join_type, order_id))
+        if cur.rowcount == 0:
+            return False
+        cur.execute(f"""
+            UPDATE subscriber_orders
+            SET current = current + 1,
+                priority_score = {order_score_sql("current + 1")},
+                rand_key = {RANDOM_KEY_SQL}
+            WHERE order_id = ? AND current < required
+        """, (order_id,))
+        if cur.rowcount == 0:
+            return False
+        # در UPDATE همه‌ی عبارت‌ها مقدار قبلی coin_fraction را می‌بینند
+        cur.execute("""
+            UPDATE users
+            SET coin_balance = coin_balance + CAST(coin_fraction + ? AS INTEGER),
+                coin_fraction = (coin_fraction + ?) - CAST(coin_fraction + ? AS INTEGER)
+            WHERE user_id = ?
+        """, (reward, reward, reward, user_id))
+        cur.execute("""
+            INSERT INTO transactions (type, amount, description)
+            VALUES (?, ?, ?)
+        """, (tx_type, reward, description))
+        conn.commit()
+        return True
+    finally:
+        # اگر commit انجام نشده باشد، close تراکنش را لغو می‌کند
+        conn.close()
+
 # ==================== مدیریت عضویت کانال‌ها (joined_channels) ====================
 def get_all_joined_members():
     conn = get_connection()
     cur = conn.cursor()
+    cur.row_factory = JoinedChannelRow
     cur.execute("SELECT * FROM joined_channels")
     rows = cur.fetchall()
     conn.close()
     return rows
 
+def iter_all_joined_members(batch_size=DB_PAGE_SIZE):
+    """نسخه‌ی جریانی get_all_joined_members"""
+    return iter_keyset("joined_channels", "id", batch_size=batch_size)
+
+def get_paid_joins_batch(after_id=0, limit=200):
+    """
+    عضویت‌هایی که بابت آن‌ها سکه پرداخت شده (order_id دارند) و خروجشان هنوز ثبت نشده، به ترتیب id و بعد از after_id.
+    عضویت‌های بایگانی‌شده هم برگردانده می‌شوند (id ردیف در بایگانی حفظ می‌شود) تا بازرسی عضویت آن‌ها را از دست ندهد.
+    """
+    columns = ARCHIVE_COLUMNS["joined_channels"]
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.row_factory = JoinedChannelRow
+    cur.execute(f"""
+        SELECT {columns} FROM joined_channels
+        WHERE id > ? AND order_id IS NOT NULL AND left_at IS NULL
+        UNION ALL
+        SELECT {columns} FROM joined_channels_archive
+        WHERE id > ? AND order_id IS NOT NULL AND left_at IS NULL
+        ORDER BY id
+        LIMIT ?
+    """, (after_id, after_id, limit))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+def apply_leaver_penalties(leavers, penalty):
+    """
+    اعمال جریمه‌ی کاربرانی که از کانال خارج شده‌اند، همه در یک تراکنش:
+    ثبت در membership_violations، ثبت left_at در ردیف joined_channels، یک اخطار و کسر penalty سکه و ثبت تراکنش.
+    ردیف عضویت حذف نمی‌شود: با حذف آن، سفارش‌های همان کانال دوباره در فید جمع‌کننده ظاهر می‌شدند و
+    عضویت دوباره پاداش می‌گرفت (چرخه‌ی عضویت، دریافت سکه، خروج و جریمه).
+    leavers ردیف‌های joined_channels است؛ خروجی تعداد جریمه‌های اعمال‌شده است.
+    """
+    if not leavers:
+        return 0
+    conn = get_connection()
+    cur = conn.cursor()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # فقط ردیف‌هایی که همین حالا علامت خروج گرفتند جریمه می‌شوند؛ اگر پردازه‌ی دیگری زودتر
+        # همان ردیف را پردازش کرده باشد، جریمه دوباره اعمال نمی‌شود.
+        applied = []
+        for row in leavers:
+            for table in ("joined_channels", "joined_channels_archive"):
+                cur.execute(f"UPDATE {table} SET left_at = CURRENT_TIMESTAMP WHERE id = ? AND left_at IS NULL",
+                            (row["id"],))
+                if cur.rowcount:
+                    break
+            if cur.rowcount:
+                applied.append(row)
+        leavers = applied
+        cur.executemany("""
+            INSERT INTO membership_violations (user_id, channel_username, order_id, penalty, joined_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(row["user_id"], row["channel_username"], row["order_id"], penalty, row["created_at"])
+              for row in leavers])
+        cur.executemany("""
+            UPDATE users SET warnings = warnings + 1, coin_balance = coin_balance - ?
+            WHERE user_id = ?
+        """, [(penalty, row["user_id"]) for row in leavers])
+        cur.executemany("""
+            INSERT INTO transactions (type, amount, description)
+            VALUES ('leave_penalty', ?, ?)
+        """, [(-penalty, f"{row['user_id']} left {row['channel_username']}") for row in leavers])
+        conn.commit()
+        return len(leavers)
+    finally:
+        conn.close()
+
 def add_joined_channel(user_id, channel_username, join_type, order_id=None):
     conn = get_connection()
     cur = conn.cursor()
@@ -361,10 +1002,11 @@ def add_joined_channel(user_id, channel_username, join_type, order_id=None):
 def remove_joined_channel(user_id, channel_username, join_type):
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("""
-        DELETE FROM joined_channels
-        WHERE user_id = ? AND channel_username = ? AND join_type = ?
-    """, (user_id, channel_username, join_type))
+    for table in ("joined_channels", "joined_channels_archive"):
+        cur.execute(f"""
+            DELETE FROM {table}
+            WHERE user_id = ? AND channel_username = ? AND join_type = ?
+        """, (user_id, channel_username, join_type))
     conn.commit()
     conn.close()
 
@@ -384,6 +1026,7 @@ def execute_raw_sql(query, params: tuple = ()):
 def get_available_orders_for_collector(collector_id):
     conn = get_connection()
     cur = conn.cursor()
+    cur.row_factory = SubscriberOrderRow
     cur.execute("""
         SELECT * FROM subscriber_orders
         WHERE user_id != ? AND current < required
@@ -392,6 +1035,11 @@ def get_available_orders_for_collector(collector_id):
     conn.close()
     return orders
 
+def iter_available_orders_for_collector(collector_id, batch_size=DB_PAGE_SIZE):
+    """نسخه‌ی جریانی get_available_orders_for_collector"""
+    return iter_keyset("subscriber_orders", "order_id", "user_id != ? AND current < required",
+                       (collector_id,), batch_size=batch_size)
+
 # ==================== مدیریت سفارش‌های خرید سکه (coin_orders) ====================
 def create_coin_order(user_id, quantity, price, receipt_file_id):
     conn = get_connection()
@@ -410,6 +1058,11 @@ def get_coin_order(order_id):
     cur = conn.cursor()
     cur.execute("SELECT * FROM coin_orders WHERE order_id = ?", (order_id,))
     order = cur.fetchone()
+    if order is None:
+        # خریدهای بررسی‌شده‌ی قدیمی به بایگانی منتقل شده‌اند
+        cur.execute(f"SELECT {ARCHIVE_COLUMNS['coin_orders']} FROM coin_orders_archive WHERE order_id = ?",
+                    (order_id,))
+        order = cur.fetchone()
     conn.close()
     return order
 
@@ -421,11 +1074,21 @@ def update_coin_order_status(order_id, status, admin_id):
         SET status = ?, admin_id = ?
         WHERE order_id = ?
     """, (status, admin_id, order_id))
+    if cur.rowcount == 0:
+        cur.execute("UPDATE coin_orders_archive SET status = ?, admin_id = ? WHERE order_id = ?",
+                    (status, admin_id, order_id))
     conn.commit()
     conn.close()
 
 # ==================== مدیریت ارجاعات (referrals) ====================
+# جفت‌های (referrer_id, referred_user_id) که ثبت‌شدنشان قطعی است؛ ارجاع هرگز حذف نمی‌شود،
+# پس این کش LRU بدون انقضا همیشه معتبر است و بررسی تکراری‌ها معمولاً به دیتابیس نمی‌رسد.
+_referral_cache = TTLCache(maxsize=REFERRAL_CACHE_SIZE)
+
 def check_referral_exists_db(referrer_id, referred_user_id):
+    key = (referrer_id, referred_user_id)
+    if key in _referral_cache:
+        return True
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("""
@@ -434,56 +1097,313 @@ def check_referral_exists_db(referrer_id, referred_user_id):
     """, (referrer_id, referred_user_id))
     exists = cur.fetchone() is not None
     conn.close()
+    if exists:
+        _referral_cache.set(key, True)
     return exists
 
 def register_referral_db(referrer_id, referred_user_id):
+    """ثبت ارجاع؛ True یعنی ارجاع جدید بود و False یعنی قبلاً ثبت شده بود"""
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("""
         INSERT OR IGNORE INTO referrals (referrer_id, referred_user_id)
         VALUES (?, ?)
     """, (referrer_id, referred_user_id))
+    created = cur.rowcount == 1
     conn.commit()
     conn.close()
+    _referral_cache.set((referrer_id, referred_user_id), True)
+    return created
 
-_referrals = {}
+# نام‌های قدیمی؛ ارجاع‌ها دیگر در دیکشنری حافظه نگه داشته نمی‌شوند و با راه‌اندازی مجدد از بین نمی‌روند
 def check_referral_exists(referrer_id, referred_user_id):
-    return referred_user_id in _referrals.get(referrer_id, set())
+    return check_referral_exists_db(referrer_id, referred_user_id)
 
 def register_referral(referrer_id, referred_user_id):
-    if referrer_id in _referrals:
-        _referrals[referrer_id].add(referred_user_id)
-    else:
-        _referrals[referrer_id] = {referred_user_id}
-    print(f"Referral registered: {referrer_id} -> {referred_user_id}")
+    return register_referral_db(referrer_id, referred_user_id)
+
+def get_referral_counts(referrer_ids):
+    """تعداد زیرمجموعه‌های چند کاربر با یک کوئری در هر ۵۰۰ شناسه؛ خروجی {referrer_id: تعداد}"""
+    referrer_ids = list(referrer_ids)
+    counts = dict.fromkeys(referrer_ids, 0)
+    conn = get_connection()
+    cur = conn.cursor()
+    for start in range(0, len(referrer_ids), 500):
+        chunk = referrer_ids[start:start + 500]
+        cur.execute(f"""
+            SELECT referrer_id, COUNT(*) AS referrals FROM referrals
+            WHERE referrer_id IN ({", ".join("?" * len(chunk))})
+            GROUP BY referrer_id
+        """, chunk)
+        for row in cur.fetchall():
+            counts[row["referrer_id"]] = row["referrals"]
+    conn.close()
+    return counts
+
+def get_referral_count(referrer_id):
+    return get_referral_counts([referrer_id])[referrer_id]
+
+def get_referral_leaderboard(limit=10):
+    """کاربران با بیشترین زیرمجموعه: لیست {referrer_id, referrals}"""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT referrer_id, COUNT(*) AS referrals FROM referrals
+        GROUP BY referrer_id
+        ORDER BY referrals DESC, referrer_id
+        LIMIT ?
+    """, (limit,))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
 
 def get_referral_keyboard():
     from telegram import ReplyKeyboardMarkup
     return ReplyKeyboardMarkup([["✅ تایید زیرمجموعه"]], resize_keyboard=True)
 
+# ==================== پیام همگانی (broadcasts) ====================
+def create_broadcast(admin_id, message):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO broadcasts (admin_id, message) VALUES (?, ?)", (admin_id, message))
+    broadcast_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+    return broadcast_id
+
+def get_broadcast(broadcast_id):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM broadcasts WHERE broadcast_id = ?", (broadcast_id,))
+    broadcast = cur.fetchone()
+    conn.close()
+    return broadcast
+
+def get_running_broadcasts():
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY broadcast_id")
+    broadcasts = cur.fetchall()
+    conn.close()
+    return broadcasts
+
+def claim_broadcast(broadcast_id, owner, lease_seconds):
+    """
+    گرفتن اجاره‌ی ارسال یک پیام همگانی در حال اجرا برای owner (شناسه‌ی یکتای هر اجرا).
+    فقط اگر پیام مالک نداشته باشد، اجاره‌ی مالک قبلی (مثلاً پردازه‌ی از کار افتاده) تمام شده باشد یا
+    مالک همین owner باشد موفق می‌شود؛ بنابراین از چند پردازه‌ی همزمان فقط یکی ارسال می‌کند.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE broadcasts
+        SET owner = ?, lease_until = datetime('now', ?)
+        WHERE broadcast_id = ? AND status = 'running'
+          AND (owner IS NULL OR owner = ? OR lease_until IS NULL OR lease_until < datetime('now'))
+    """, (owner, f"+{int(lease_seconds)} seconds", broadcast_id, owner))
+    claimed = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return claimed
+
+def update_broadcast_progress(broadcast_id, last_user_id, sent_delta, failed_delta, owner=None, lease_seconds=0):
+    """
+    ثبت پیشرفت پس از هر دسته؛ ارسال پس از راه‌اندازی مجدد از last_user_id ادامه پیدا می‌کند.
+    با owner فقط مالک فعلی ثبت می‌کند و اجاره‌اش lease_seconds ثانیه تمدید می‌شود؛ False یعنی اجاره از دست رفته است.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    if owner is None:
+        cur.execute("""
+            UPDATE broadcasts
+            SET last_user_id = ?, sent = sent + ?, failed = failed + ?
+            WHERE broadcast_id = ?
+        """, (last_user_id, sent_delta, failed_delta, broadcast_id))
+    else:
+        cur.execute("""
+            UPDATE broadcasts
+            SET last_user_id = ?, sent = sent + ?, failed = failed + ?, lease_until = datetime('now', ?)
+            WHERE broadcast_id = ? AND owner = ?
+        """, (last_user_id, sent_delta, failed_delta, f"+{int(lease_seconds)} seconds", broadcast_id, owner))
+    updated = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+def release_broadcast(broadcast_id, owner):
+    """رها کردن اجاره (مثلاً هنگام خاموش شدن) تا پردازه‌ی دیگری بدون انتظار ادامه دهد"""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("UPDATE broadcasts SET owner = NULL, lease_until = NULL WHERE broadcast_id = ? AND owner = ?",
+                (broadcast_id, owner))
+    conn.commit()
+    conn.close()
+
+def finish_broadcast(broadcast_id, status="done"):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE broadcasts
+        SET status = ?, finished_at = CURRENT_TIMESTAMP, owner = NULL, lease_until = NULL
+        WHERE broadcast_id = ?
+    """, (status, broadcast_id))
+    conn.commit()
+    conn.close()
+
+# ==================== وضعیت ماندگار گفتگوها (persistence) ====================
+def get_persisted_user_data(user_id):
+    """user_data سریال‌شده‌ی یک کاربر (bytes) یا None"""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT data FROM persisted_user_data WHERE user_id = ?", (user_id,))
+    row = cur.fetchone()
+    conn.close()
+    return row["data"] if row else None
+
+def get_persisted_conversations(name):
+    """همه‌ی گفتگوهای باز یک ConversationHandler: لیست (conversation_key, state)"""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT conversation_key, state FROM persisted_conversations WHERE name = ?", (name,))
+    rows = [(row["conversation_key"], row["state"]) for row in cur.fetchall()]
+    conn.close()
+    return rows
+
+def save_persistence_batch(user_data, conversations):
+    """
+    نوشتن یک دسته تغییر در یک تراکنش.
+    user_data: {user_id: bytes یا None برای حذف}
+    conversations: {(name, conversation_key): bytes یا None برای حذف (پایان گفتگو)}
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.executemany("INSERT OR REPLACE INTO persisted_user_data (user_id, data) VALUES (?, ?)",
+                        [(user_id, data) for user_id, data in user_data.items() if data is not None])
+        cur.executemany("DELETE FROM persisted_user_data WHERE user_id = ?",
+                        [(user_id,) for user_id, data in user_data.items() if data is None])
+        cur.executemany("INSERT OR REPLACE INTO persisted_conversations (name, conversation_key, state) VALUES (?, ?, ?)",
+                        [(name, key, state) for (name, key), state in conversations.items() if state is not None])
+        cur.executemany("DELETE FROM persisted_conversations WHERE name = ? AND conversation_key = ?",
+                        [(name, key) for (name, key), state in conversations.items() if state is None])
+        conn.commit()
+    finally:
+        conn.close()
+
 # ==================== تنظیمات (settings) ====================
-def update_welcome_message(message):
+# نوع و مقدار پیش‌فرض تنظیمات شناخته‌شده؛ کلیدهای دیگر به صورت متن برگردانده می‌شوند
+SETTINGS_SCHEMA = {
+    "welcome_message": (str, "خوش آمدید!"),
+}
+# ردیفی در settings که با هر تغییر یک واحد زیاد می‌شود تا پردازه‌های دیگر کش خود را تازه کنند
+SETTINGS_VERSION_KEY = "__version__"
+
+_settings_cache = None
+_settings_version = None
+_settings_checked_at = 0.0
+_settings_lock = threading.Lock()
+
+def load_settings():
+    """خواندن همه‌ی تنظیمات در حافظه؛ هنگام راه‌اندازی و پس از تغییر نسخه صدا زده می‌شود"""
+    global _settings_cache, _settings_version, _settings_checked_at
     conn = get_connection()
     cur = conn.cursor()
+    cur.execute("SELECT key, value FROM settings")
+    values = {row["key"]: row["value"] for row in cur.fetchall()}
+    conn.close()
+    with _settings_lock:
+        _settings_version = values.pop(SETTINGS_VERSION_KEY, None)
+        _settings_cache = values
+        _settings_checked_at = time.monotonic()
+
+def _settings_are_stale():
+    global _settings_checked_at
+    if _settings_cache is None:
+        return True
+    if time.monotonic() - _settings_checked_at < SETTINGS_VERSION_CHECK_INTERVAL:
+        return False
+    conn = get_connection()
+    row = conn.execute("SELECT value FROM settings WHERE key = ?", (SETTINGS_VERSION_KEY,)).fetchone()
+    conn.close()
+    _settings_checked_at = time.monotonic()
+    return (row["value"] if row else None) != _settings_version
+
+def _cast_setting(value_type, value):
+    if value_type is bool:
+        return value in ("1", "true", "True")
+    return value_type(value)
+
+def get_setting(key, default=None):
+    """
+    مقدار یک تنظیم از کش حافظه با نوع تعریف‌شده در SETTINGS_SCHEMA.
+    دیتابیس فقط حداکثر هر SETTINGS_VERSION_CHECK_INTERVAL ثانیه برای بررسی نسخه خوانده می‌شود.
+    """
+    if _settings_are_stale():
+        load_settings()
+    value_type, schema_default = SETTINGS_SCHEMA.get(key, (str, None))
+    if default is None:
+        default = schema_default
+    value = _settings_cache.get(key)
+    if value is None:
+        return default
+    try:
+        return _cast_setting(value_type, value)
+    except (TypeError, ValueError):
+        return default
+
+def set_setting(key, value):
+    """ذخیره‌ی یک تنظیم، افزایش نسخه‌ی تنظیمات و به‌روزرسانی کش همین پردازه"""
+    global _settings_version
+    if isinstance(value, bool):
+        value = "1" if value else "0"
+    value = None if value is None else str(value)
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
     cur.execute("""
-        INSERT OR REPLACE INTO settings (key, value)
-        VALUES ('welcome_message', ?)
-    """, (message,))
+        INSERT INTO settings (key, value) VALUES (?, '1')
+        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+    """, (SETTINGS_VERSION_KEY,))
+    cur.execute("SELECT value FROM settings WHERE key = ?", (SETTINGS_VERSION_KEY,))
+    version = cur.fetchone()["value"]
     conn.commit()
     conn.close()
+    with _settings_lock:
+        if _settings_cache is not None:
+            _settings_cache[key] = value
+            _settings_version = version
 
-def get_welcome_message():
+# ==================== نقطه‌ی ادامه‌ی jobها (job_checkpoints) ====================
+# جدا از settings: نوشتن آن پس از هر دسته نسخه‌ی تنظیمات را عوض نمی‌کند و کش پردازه‌ها معتبر می‌ماند
+def get_job_checkpoint(name, default=0):
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("SELECT value FROM settings WHERE key = 'welcome_message'")
-    result = cur.fetchone()
+    cur.execute("SELECT value FROM job_checkpoints WHERE name = ?", (name,))
+    row = cur.fetchone()
     conn.close()
-    if result:
-        return result.get("value", "خوش آمدید!")
-    return "خوش آمدید!"
+    return row["value"] if row else default
+
+def set_job_checkpoint(name, value):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO job_checkpoints (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+    """, (name, value))
+    conn.commit()
+    conn.close()
+
+def update_welcome_message(message):
+    set_setting("welcome_message", message)
+
+def get_welcome_message():
+    return get_setting("welcome_message")
 
 # ==================== مدیریت تراکنش‌ها (transactions) ====================
 def add_transaction(tx_type, amount, description=""):
+    if _write_behind is not None:
+        _write_behind.add_transaction(tx_type, amount, description)
+        return
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("""
@@ -494,14 +1414,59 @@ def add_transaction(tx_type, amount, description=""):
     conn.close()
 
 def get_transactions(limit=5):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM transactions ORDER BY date DESC LIMIT ?", (limit,))
-    transactions = cur.fetchall()
+    """آخرین تراکنش‌ها، همراه با تراکنش‌های بافر نوشتن تأخیری (با id برابر None) و در صورت نیاز بایگانی"""
+    buffer = _write_behind
+    with buffer.consistent_read() if buffer is not None else contextlib.nullcontext():
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM transactions ORDER BY date DESC LIMIT ?", (limit,))
+        transactions = cur.fetchall()
+        pending = buffer.pending_transactions() if buffer is not None else []
+    if pending:
+        # تراکنش‌های بافر جدیدترند و در زمان برابر جلوتر می‌مانند (sorted پایدار است)
+        transactions = sorted(
+            [{"id": None, "type": tx_type, "amount": amount, "date": date, "description": description}
+             for tx_type, amount, date, description in reversed(pending)] + list(transactions),
+            key=lambda tx: tx["date"], reverse=True,
+        )[:limit]
+    if len(transactions) < limit:
+        cur.execute(f"""
+            SELECT {ARCHIVE_COLUMNS['transactions']} FROM transactions_archive
+            ORDER BY date DESC LIMIT ?
+        """, (limit - len(transactions),))
+        transactions += cur.fetchall()
     conn.close()
     return transactions
 
 # ==================== مدیریت عضویت اجباری ====================
+# توابعی که پس از هر تغییر در forced_channels صدا زده می‌شوند: callback(event, channel_username)
+_forced_channel_listeners = []
+
+# نسخه‌ی پردازش‌شده‌ی forced_channels در حافظه؛ None یعنی باید دوباره از دیتابیس خوانده شود
+_forced_channels_snapshot = None
+_forced_channels_loaded_at = 0.0
+_forced_channels_generation = 0
+_forced_channels_lock = threading.Lock()
+
+def add_forced_channel_listener(callback):
+    """ثبت تابعی برای اطلاع از رویدادهای 'added'، 'removed' و 'incremented' کانال‌های اجباری"""
+    _forced_channel_listeners.append(callback)
+
+def _invalidate_forced_channels():
+    """کنار گذاشتن نسخه‌ی حافظه‌ی forced_channels تا خواندن بعدی از دیتابیس انجام شود"""
+    global _forced_channels_snapshot, _forced_channels_generation
+    with _forced_channels_lock:
+        _forced_channels_generation += 1
+        _forced_channels_snapshot = None
+
+def _notify_forced_channel_listeners(event, channel_username):
+    _invalidate_forced_channels()
+    for callback in list(_forced_channel_listeners):
+        try:
+            callback(event, channel_username)
+        except Exception as e:
+            print("Forced channel listener error:", e)
+
 def add_forced_channel(channel_username, limit_type, limit_value):
     conn = get_connection()
     cur = conn.cursor()
@@ -511,6 +1476,7 @@ def add_forced_channel(channel_username, limit_type, limit_value):
     """, (channel_username, limit_type, str(limit_value)))
     conn.commit()
     conn.close()
+    _notify_forced_channel_listeners("added", channel_username)
 
 def get_active_forced_channels():
     conn = get_connection()
@@ -526,13 +1492,80 @@ def remove_forced_channel(channel_username):
     cur.execute("DELETE FROM forced_channels WHERE channel_username = ?", (channel_username,))
     conn.commit()
     conn.close()
+    _notify_forced_channel_listeners("removed", channel_username)
 
 def increment_forced_channel_count(channel_username):
+    if _write_behind is not None:
+        _write_behind.add_forced_channel_increment(channel_username)
+        return
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("UPDATE forced_channels SET current_members = current_members + 1 WHERE channel_username = ?", (channel_username,))
     conn.commit()
     conn.close()
+    _notify_forced_channel_listeners("incremented", channel_username)
+
+def _parse_forced_channel(row):
+    """محاسبه‌ی یک‌باره‌ی تاریخ انقضا و سقف اعضا؛ برای ردیف نامعتبر None برمی‌گرداند"""
+    channel = dict(row)
+    channel["expires_at"] = None
+    channel["required_members"] = None
+    try:
+        if channel["limit_type"] == "time":
+            channel["expires_at"] = datetime.datetime.fromisoformat(channel["limit_value"])
+        elif channel["limit_type"] == "members":
+            channel["required_members"] = int(channel["limit_value"])
+            channel["current_members"] = int(channel.get("current_members") or 0)
+    except (TypeError, ValueError):
+        return None
+    return channel
+
+def _is_forced_channel_valid(channel, now):
+    if channel["expires_at"] is not None:
+        return now < channel["expires_at"]
+    if channel["required_members"] is not None:
+        current_members = channel["current_members"]
+        if _write_behind is not None:
+            current_members += _write_behind.pending_forced_channel_increments(channel["channel_username"])
+        return current_members < channel["required_members"]
+    return False
+
+def refresh_forced_channels():
+    """بازخوانی forced_channels از دیتابیس و جایگزینی نسخه‌ی حافظه"""
+    global _forced_channels_snapshot, _forced_channels_loaded_at
+    generation = _forced_channels_generation
+    loaded_at = time.monotonic()
+    snapshot = [channel for channel in map(_parse_forced_channel, get_active_forced_channels()) if channel]
+    with _forced_channels_lock:
+        # اگر در حین خواندن تغییری ثبت شده باشد، این نسخه کهنه است و ذخیره نمی‌شود
+        if generation == _forced_channels_generation:
+            _forced_channels_snapshot = snapshot
+            _forced_channels_loaded_at = loaded_at
+    return snapshot
+
+def get_valid_forced_channels(now=None):
+    """
+    کانال‌های اجباری که هنوز مهلت یا ظرفیت دارند، از نسخه‌ی حافظه.
+    فقط بعد از تغییر کانال‌ها، اولین فراخوانی یا کهنه شدن نسخه‌ی حافظه کوئری اجرا می‌شود؛ حذف منقضی‌ها کار expire_forced_channels است.
+    """
+    snapshot = _forced_channels_snapshot
+    # تغییرات پردازه‌های دیگر (حالت چندپردازه‌ای) حداکثر پس از FORCED_CHANNELS_REFRESH_INTERVAL دیده می‌شوند
+    if snapshot is None or time.monotonic() - _forced_channels_loaded_at > FORCED_CHANNELS_REFRESH_INTERVAL:
+        snapshot = refresh_forced_channels()
+    now = now or datetime.datetime.now()
+    return [channel for channel in snapshot if _is_forced_channel_valid(channel, now)]
+
+def expire_forced_channels(now=None):
+    """حذف کانال‌هایی که مهلت یا ظرفیتشان تمام شده است؛ برای اجرای دوره‌ای. نام کانال‌های حذف‌شده برگردانده می‌شود"""
+    now = now or datetime.datetime.now()
+    expired = [
+        channel["channel_username"]
+        for channel in refresh_forced_channels()
+        if not _is_forced_channel_valid(channel, now)
+    ]
+    for channel_username in expired:
+        remove_forced_channel(channel_username)
+    return expired
 
 def is_user_joined_forced_channel(user_id, channel_username):
     conn = get_connection()
@@ -540,7 +1573,11 @@ def is_user_joined_forced_channel(user_id, channel_username):
     cur.execute("""
         SELECT 1 FROM joined_channels
         WHERE user_id = ? AND channel_username = ? AND join_type = 'forced'
-    """, (user_id, channel_username))
+        UNION ALL
+        SELECT 1 FROM joined_channels_archive
+        WHERE user_id = ? AND channel_username = ? AND join_type = 'forced'
+        LIMIT 1
+    """, (user_id, channel_username, user_id, channel_username))
     result = cur.fetchone()
     conn.close()
     return result is not None
@@ -554,19 +1591,45 @@ def get_admin_id():
 import random
 
 def get_random_orders(collector_id, limit=10):
-    orders = get_available_orders_for_collector(collector_id)
+    """
+    نمونه‌ی تصادفی از سفارش‌های باز دیگران بدون بارگذاری همه‌ی سفارش‌ها:
+    از نقطه‌ای تصادفی روی ایندکس rand_key (که هنگام ثبت هر سفارش تصادفی مقداردهی می‌شود)
+    حداکثر limit سفارش خوانده می‌شود و در صورت رسیدن به انتها از ابتدای ایندکس ادامه می‌یابد.
+    rand_key با هر update_order_current دوباره تصادفی می‌شود تا همسایه‌های ثابت در ایندکس باقی نمانند.
+    """
+    start = random.random()
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.row_factory = SubscriberOrderRow
+    cur.execute(f"""
+        SELECT * FROM subscriber_orders
+        WHERE {COLLECTOR_FEED_FILTER} AND rand_key >= ?
+        ORDER BY rand_key
+        LIMIT ?
+    """, (collector_id, collector_id, collector_id, start, limit))
+    orders = cur.fetchall()
+    if len(orders) < limit:
+        cur.execute(f"""
+            SELECT * FROM subscriber_orders
+            WHERE {COLLECTOR_FEED_FILTER} AND rand_key < ?
+            ORDER BY rand_key
+            LIMIT ?
+        """, (collector_id, collector_id, collector_id, start, limit - len(orders)))
+        orders += cur.fetchall()
+    conn.close()
     random.shuffle(orders)
-    return orders[:limit]
+    return orders
 
 def get_recent_orders(collector_id, limit=10):
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("""
+    cur.row_factory = SubscriberOrderRow
+    cur.execute(f"""
         SELECT * FROM subscriber_orders
-        WHERE user_id != ? AND current < required
+        WHERE {COLLECTOR_FEED_FILTER}
         ORDER BY created_at DESC
         LIMIT ?
-    """, (collector_id, limit))
+    """, (collector_id, collector_id, collector_id, limit))
     recent_orders = cur.fetchall()
     conn.close()
     return recent_orders
@@ -574,13 +1637,345 @@ def get_recent_orders(collector_id, limit=10):
 def get_ending_orders(collector_id, limit=10):
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("""
+    cur.row_factory = SubscriberOrderRow
+    cur.execute(f"""
         SELECT *, (current * 1.0 / required) AS progress
         FROM subscriber_orders
-        WHERE user_id != ? AND current < required
+        WHERE {COLLECTOR_FEED_FILTER}
         ORDER BY progress DESC
         LIMIT ?
-    """, (collector_id, limit))
+    """, (collector_id, collector_id, collector_id, limit))
     ending_orders = cur.fetchall()
     conn.close()
-    return ending_orders
\ No newline at end of file
+    return ending_orders
+
+# ==================== بایگانی ردیف‌های قدیمی (archive) ====================
+# ستون‌های مشترک هر جدول و نسخه‌ی بایگانی آن (جدول بایگانی فقط archived_at اضافه دارد)
+ARCHIVE_COLUMNS = {
+    "subscriber_orders": "order_id, user_id, channel_username, required, current, created_at",
+    "joined_channels": "id, user_id, channel_username, join_type, order_id, created_at, left_at",
+    "coin_orders": "order_id, user_id, quantity, price, receipt_file_id, status, created_at, admin_id",
+    "transactions": "id, type, amount, date, description",
+}
+
+# کلید اصلی و کوئری انتخاب ردیف‌های قابل بایگانی هر جدول؛ پارامترها: (عمر به شکل "-N days"، حداکثر تعداد)
+_ARCHIVE_CANDIDATES = {
+    # سفارش‌های تکمیل‌شده از ایندکس جزئی idx_subscriber_orders_completed
+    "subscriber_orders": ("order_id", """
+        SELECT order_id FROM subscriber_orders
+        WHERE current >= required AND created_at < datetime('now', ?)
+        ORDER BY created_at LIMIT ?
+    """),
+    # id به ترتیب زمان ثبت است؛ فقط ابتدای جدول بررسی می‌شود تا نبود ردیف قدیمی به پیمایش کامل نینجامد
+    "joined_channels": ("id", """
+        SELECT id FROM joined_channels
+        WHERE created_at < datetime('now', ?)
+          AND id IN (SELECT id FROM joined_channels ORDER BY id LIMIT ?)
+    """),
+    # فقط خریدهای بررسی‌شده (تأیید یا رد)؛ خریدهای در انتظار همیشه در جدول اصلی می‌مانند
+    "coin_orders": ("order_id", """
+        SELECT order_id FROM coin_orders
+        WHERE status != 'pending' AND created_at < datetime('now', ?)
+        ORDER BY created_at LIMIT ?
+    """),
+    "transactions": ("id", """
+        SELECT id FROM transactions
+        WHERE date < datetime('now', ?)
+        ORDER BY date LIMIT ?
+    """),
+}
+
+def archive_batch(table, older_than_days, limit=500):
+    """
+    انتقال حداکثر limit ردیف قابل بایگانی table (قدیمی‌تر از older_than_days روز) به {table}_archive.
+    هر دسته یک تراکنش کوتاه جداگانه است تا قفل نوشتن طولانی نگه داشته نشود؛ خروجی تعداد ردیف منتقل‌شده است
+    و کمتر از limit یعنی فعلاً ردیف دیگری برای بایگانی نمانده است. زمان‌بندی دسته‌ها در archive.py است.
+    """
+    key, candidates_sql = _ARCHIVE_CANDIDATES[table]
+    columns = ARCHIVE_COLUMNS[table]
+    conn = get_connection()
+    cur = conn.cursor()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(candidates_sql, (f"-{int(older_than_days)} days", limit))
+        ids = [row[key] for row in cur.fetchall()]
+        if not ids:
+            return 0
+        placeholders = ", ".join("?" * len(ids))
+        cur.execute(f"""
+            INSERT OR REPLACE INTO {table}_archive ({columns})
+            SELECT {columns} FROM {table} WHERE {key} IN ({placeholders})
+        """, ids)
+        cur.execute(f"DELETE FROM {table} WHERE {key} IN ({placeholders})", ids)
+        conn.commit()
+        return len(ids)
+    finally:
+        conn.close()
+
+# ==================== بافر نوشتن تأخیری (write-behind) ====================
+class WriteBehindBuffer:
+    """
+    جمع‌آوری تغییرات کوچک و پرتکرار (شمارنده‌ی کانال‌های اجباری، اخطارها و تراکنش‌ها)
+    در حافظه و نوشتن همه در یک تراکنش؛
+    هر flush_interval ثانیه یا وقتی تعداد تغییرات به max_pending برسد.
+    """
+
+    def __init__(self, flush_interval=WRITE_BEHIND_FLUSH_INTERVAL, max_pending=WRITE_BEHIND_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        # commit هر flush و پاک شدن تغییرات آن از بافر زیر این قفل انجام می‌شود (consistent_read)
+        self._commit_lock = threading.Lock()
+        # تغییراتی که در حال نوشتن هستند تا commit برای خواندن‌ها حساب می‌شوند
+        self._inflight_forced_channels = {}
+        self._inflight_warnings = {}
+        self._inflight_transactions = []
+        self._reset()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+
+    def _reset(self):
+        self._forced_channels = {}
+        self._warnings = {}
+        self._transactions = []
+        self._pending = 0
+
+    def _added(self):
+        # فراخوانی با قفل گرفته‌شده
+        self._pending += 1
+        if self._pending == 1 or self._pending >= self.max_pending:
+            self._wakeup.notify()
+
+    def add_forced_channel_increment(self, channel_username):
+        with self._lock:
+            self._forced_channels[channel_username] = self._forced_channels.get(channel_username, 0) + 1
+            self._added()
+
+    def add_warnings(self, user_id, delta):
+        with self._lock:
+            self._warnings[user_id] = self._warnings.get(user_id, 0) + delta
+            self._added()
+
+    def add_transaction(self, tx_type, amount, description=""):
+        # زمان ثبت همین حالا گرفته می‌شود (CURRENT_TIMESTAMP هم به وقت UTC است)
+        date = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._transactions.append((tx_type, amount, date, description))
+            self._added()
+
+    def pending_warnings(self, user_id):
+        with self._lock:
+            return self._warnings.get(user_id, 0) + self._inflight_warnings.get(user_id, 0)
+
+    def pending_forced_channel_increments(self, channel_username):
+        with self._lock:
+            return (self._forced_channels.get(channel_username, 0)
+                    + self._inflight_forced_channels.get(channel_username, 0))
+
+    def pending_transactions(self):
+        """تراکنش‌های نوشته‌نشده به شکل (type, amount, date, description)، به ترتیب ثبت"""
+        with self._lock:
+            return self._inflight_transactions + self._transactions
+
+    def consistent_read(self):
+        """
+        قفلی که خواننده‌ها هنگام خواندن دیتابیس و مقدارهای pending_* نگه می‌دارند؛
+        بدون آن، خواندن بین commit یک flush و پاک شدن تغییراتش از بافر آن تغییرات را دوبار می‌شمارد.
+        """
+        return self._commit_lock
+
+    def _clear_inflight(self):
+        with self._lock:
+            self._inflight_forced_channels, self._inflight_warnings, self._inflight_transactions = {}, {}, []
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._stopped:
+                    self._wakeup.wait()
+                if self._stopped:
+                    return
+                # پنجره‌ی جمع‌آوری: از اولین تغییر تا flush_interval یا پر شدن بافر
+                if self._pending < self.max_pending:
+                    self._wakeup.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """نوشتن همه‌ی تغییرات در انتظار در یک تراکنش"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                forced_channels, warnings, transactions = self._forced_channels, self._warnings, self._transactions
+                self._inflight_forced_channels, self._inflight_warnings = forced_channels, warnings
+                self._inflight_transactions = transactions
+                self._reset()
+            try:
+                self._write(forced_channels, warnings, transactions)
+            except Exception as e:
+                print("Write-behind flush error:", e)
+                self._restore(forced_channels, warnings, transactions)
+                return
+            for channel_username in forced_channels:
+                _notify_forced_channel_listeners("incremented", channel_username)
+
+    def _write(self, forced_channels, warnings, transactions):
+        conn = get_connection()
+        cur = conn.cursor()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur.executemany(
+                "UPDATE forced_channels SET current_members = current_members + ? WHERE channel_username = ?",
+                [(delta, channel_username) for channel_username, delta in forced_channels.items()],
+            )
+            cur.executemany(
+                "UPDATE users SET warnings = warnings + ? WHERE user_id = ?",
+                [(delta, user_id) for user_id, delta in warnings.items()],
+            )
+            cur.executemany(
+                "INSERT INTO transactions (type, amount, date, description) VALUES (?, ?, ?, ?)",
+                transactions,
+            )
+            with self._commit_lock:
+                conn.commit()
+                self._clear_inflight()
+                if forced_channels:
+                    _invalidate_forced_channels()
+        finally:
+            conn.close()
+
+    def _restore(self, forced_channels, warnings, transactions):
+        # تغییرات نوشته‌نشده به بافر برمی‌گردند تا در flush بعدی دوباره امتحان شوند
+        with self._lock:
+            for target, source in ((self._forced_channels, forced_channels), (self._warnings, warnings)):
+                for key, delta in source.items():
+                    target[key] = target.get(key, 0) + delta
+            self._transactions[:0] = transactions
+            self._pending += len(forced_channels) + len(warnings) + len(transactions)
+            self._inflight_forced_channels, self._inflight_warnings, self._inflight_transactions = {}, {}, []
+            self._wakeup.notify()
+
+    def stop(self):
+        """توقف رشته‌ی پس‌زمینه و نوشتن تغییرات باقیمانده"""
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+        self._thread.join()
+        self.flush()
+
+_write_behind = None
+
+def enable_write_behind(flush_interval=WRITE_BEHIND_FLUSH_INTERVAL, max_pending=WRITE_BEHIND_MAX_PENDING):
+    """فعال کردن بافر نوشتن تأخیری برای increment_forced_channel_count، update_user_warnings و add_transaction"""
+    global _write_behind
+    if _write_behind is None:
+        _write_behind = WriteBehindBuffer(flush_interval, max_pending)
+        atexit.register(disable_write_behind)
+    return _write_behind
+
+def flush_pending_writes():
+    """نوشتن فوری تغییرات در انتظار (در صورت فعال بودن بافر)"""
+    if _write_behind is not None:
+        _write_behind.flush()
+
+def disable_write_behind():
+    """نوشتن تغییرات باقیمانده و بازگشت به نوشتن مستقیم؛ هنگام خاموش شدن برنامه هم صدا زده می‌شود"""
+    global _write_behind
+    buffer, _write_behind = _write_behind, None
+    if buffer is not None:
+        buffer.stop()
+
+# ==================== رابط ناهمگام (database.aio) ====================
+# توابعی که با این پیشوندها شروع می‌شوند فقط می‌خوانند و روی استخر خواندن اجرا می‌شوند؛
+# بقیه روی یک رشته‌ی نویسنده‌ی واحد اجرا می‌شوند تا نوشتن‌ها پشت هم صف شوند.
+_READ_PREFIXES = ("get_", "search_", "check_", "is_", "has_", "user_has_", "channel_exists", "fetch_", "iter_")
+# توابعی که اتصال برمی‌گردانند یا می‌بندند در database.aio نیستند: اتصال هر رشته (یا اتصال جدید)
+# روی رشته‌ی استخر ساخته می‌شود و در رشته‌ی حلقه‌ی رویداد قابل استفاده نیست
+_AIO_EXCLUDED = frozenset({"get_connection", "get_db_connection", "close_connection", "dict_factory"})
+
+class AsyncDatabase:
+    """
+    نسخه‌ی awaitable همه‌ی توابع این ماژول با همان امضا؛ مثلاً:
+        user = await database.aio.get_user(user_id)
+    فراخوانی‌ها روی رشته‌های جداگانه اجرا می‌شوند و حلقه‌ی رویداد PTB را متوقف نمی‌کنند.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reader = None
+        self._writer = None
+
+    def _executor_for(self, name):
+        with self._lock:
+            if name.startswith(_READ_PREFIXES):
+                if self._reader is None:
+                    self._reader = ThreadPoolExecutor(DB_READ_WORKERS, thread_name_prefix="db-read")
+                return self._reader
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(1, thread_name_prefix="db-write")
+            return self._writer
+
+    def __getattr__(self, name):
+        func = globals().get(name)
+        if name.startswith("_") or name in _AIO_EXCLUDED or not callable(func) or isinstance(func, type):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            # تابع در زمان فراخوانی از ماژول خوانده می‌شود تا جایگزینی‌های بعدی هم اعمال شوند
+            return await loop.run_in_executor(
+                self._executor_for(name), functools.partial(globals()[name], *args, **kwargs)
+            )
+
+        call.__name__ = name
+        setattr(self, name, call)
+        return call
+
+    async def iterate(self, name, *args, batch_size=DB_PAGE_SIZE, **kwargs):
+        """
+        نسخه‌ی async for توابع iter_*؛ هر صفحه روی استخر خواندن گرفته می‌شود:
+            async for user in database.aio.iterate("iter_all_users"):
+        """
+        loop = asyncio.get_running_loop()
+        rows = globals()[name](*args, batch_size=batch_size, **kwargs)
+        while True:
+            page = await loop.run_in_executor(
+                self._executor_for(name), list, itertools.islice(rows, batch_size)
+            )
+            if not page:
+                return
+            for row in page:
+                yield row
+
+    def shutdown(self, wait=True):
+        """توقف رشته‌های خواندن و نوشتن (هنگام خاموش شدن برنامه)"""
+        with self._lock:
+            executors, self._reader, self._writer = (self._reader, self._writer), None, None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=wait)
+
+    def _reset_after_fork(self):
+        # رشته‌های استخر در پردازه‌ی فرزند وجود ندارند؛ در اولین فراخوانی از نو ساخته می‌شوند
+        self._lock = threading.Lock()
+        self._reader = None
+        self._writer = None
+
+aio = AsyncDatabase()
+
+def _after_fork_in_child():
+    """
+    پاک‌سازی وضعیت رشته‌ای پس از fork (مثلاً workerهای حالت چندپردازه‌ای با start method برابر fork).
+    تغییرات در انتظار بافر نوشتن تأخیری متعلق به والد است و همان‌جا نوشته می‌شود؛ فرزند بافر تازه می‌سازد.
+    """
+    global _write_behind
+    buffer, _write_behind = _write_behind, None
+    if buffer is not None:
+        enable_write_behind(buffer.flush_interval, buffer.max_pending)
+    aio._reset_after_fork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,99 @@
+# instrumentation.py
+"""
+اتصال متریک‌های metrics.py به bot_app:
+  - instrument_application: زمان و نتیجه‌ی هر callback هندلر (داخل ConversationHandlerها هم)
+  - InstrumentedRequest: زمان و نتیجه‌ی هر درخواست خروجی Bot API (همه‌ی فراخوانی‌های context.bot)
+"""
+import asyncio
+import functools
+import time
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+from telegram.request import BaseRequest, HTTPXRequest
+import metrics
+
+# ==================== هندلرها ====================
+def _callback_name(callback):
+    name = getattr(callback, "__qualname__", None) or type(callback).__name__
+    module = getattr(callback, "__module__", None)
+    return f"{module}.{name}" if module else name
+
+def _timed_callback(callback):
+    name = _callback_name(callback)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        if not metrics.should_sample(metrics.HANDLER_SAMPLE_RATE):
+            return await callback(update, context)
+        outcome = "ok"
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            outcome = "stop"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            metrics.handler_seconds.observe(time.perf_counter() - started, name, outcome)
+
+    wrapper._instrumented = True
+    return wrapper
+
+def _instrument_handler(handler):
+    if isinstance(handler, ConversationHandler):
+        children = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            children.extend(state_handlers)
+        for child in children:
+            _instrument_handler(child)
+        return
+    callback = getattr(handler, "callback", None)
+    if callback is None or getattr(callback, "_instrumented", False):
+        return
+    if not asyncio.iscoroutinefunction(callback):
+        return
+    handler.callback = _timed_callback(callback)
+
+def instrument_application(application):
+    """پوشاندن callback همه‌ی هندلرهای ثبت‌شده؛ باید پس از ثبت آخرین هندلر فراخوانی شود"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler)
+
+# ==================== درخواست‌های Bot API ====================
+class InstrumentedRequest(BaseRequest):
+    """پوشش یک BaseRequest (پیش‌فرض HTTPXRequest) که مدت هر متد Bot API را ثبت می‌کند"""
+
+    def __init__(self, request=None):
+        self._request = request if request is not None else HTTPXRequest(connection_pool_size=256)
+
+    @property
+    def read_timeout(self):
+        return getattr(self._request, "read_timeout", None)
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def shutdown(self):
+        await self._request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        if not metrics.should_sample(metrics.API_SAMPLE_RATE):
+            return await self._request.do_request(
+                url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+            )
+        # آدرس به شکل .../bot<token>/<method> است؛ فقط نام متد به عنوان برچسب ثبت می‌شود
+        api_method = url.rsplit("/", 1)[-1]
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            code, payload = await self._request.do_request(
+                url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+            )
+            outcome = "ok" if code == 200 else str(code)
+            return code, payload
+        finally:
+            metrics.bot_api_seconds.observe(time.perf_counter() - started, api_method, outcome)
@@ -0,0 +1,65 @@
+# maintenance.py
+"""
+اجرای یک‌باره‌ی کارهای دوره‌ای ربات بیرون از وب‌هوک.
+در حالت inline وب‌هوک (پیش‌فرض PythonAnywhere و uWSGI بدون رشته) حلقه‌ی رویداد فقط هنگام پردازش آپدیت‌ها
+اجرا می‌شود و job_queue کار نمی‌کند؛ این اسکریپت به عنوان Scheduled task همان کارها را انجام می‌دهد:
+    python maintenance.py                    همه‌ی کارها
+    python maintenance.py expire archive     فقط کارهای نام‌برده
+کارها: expire (حذف کانال‌های اجباری منقضی‌شده)، broadcasts (ارسال پیام‌های همگانی ثبت‌شده یا نیمه‌تمام)،
+audit (بازرسی عضویت، از آخرین نقطه‌ی ذخیره‌شده) و archive (بایگانی ردیف‌های قدیمی).
+در حالت inline دستور /broadcast پیام را فقط ثبت می‌کند و ارسال آن با اجرای بعدی همین اسکریپت انجام می‌شود؛
+اجرای همزمان دو نسخه مشکلی ندارد، چون هر پیام همگانی فقط توسط صاحب اجاره‌ی آن (claim_broadcast) ارسال می‌شود.
+"""
+import asyncio
+import sys
+from telegram import Bot
+import config
+import database
+from archive import run_archive
+from broadcast import run_broadcast
+from membership_audit import run_membership_audit
+from outbound import ScheduledRequest, background_requests
+
+async def expire_forced_channels(bot):
+    await database.aio.expire_forced_channels()
+
+async def resume_broadcasts(bot):
+    for broadcast in await database.aio.get_running_broadcasts():
+        stats = await run_broadcast(bot, broadcast["broadcast_id"])
+        if stats is not None:
+            await bot.send_message(chat_id=broadcast["admin_id"], text=stats.summary())
+
+async def membership_audit(bot):
+    checked, left = await run_membership_audit(bot)
+    print(f"Membership audit finished: {checked} checked, {left} left")
+
+async def archive(bot):
+    moved = await run_archive()
+    print("Archive finished:", ", ".join(f"{table} {count}" for table, count in moved.items()))
+
+TASKS = {
+    "expire": expire_forced_channels,
+    "broadcasts": resume_broadcasts,
+    "audit": membership_audit,
+    "archive": archive,
+}
+
+async def main(names):
+    database.init_db()
+    kwargs = {"base_url": config.BOT_API_BASE_URL} if getattr(config, "BOT_API_BASE_URL", None) else {}
+    bot = Bot(config.BOT_TOKEN, request=ScheduledRequest(), **kwargs)
+    async with bot:
+        with background_requests():
+            for name in names:
+                try:
+                    await TASKS[name](bot)
+                except Exception as e:
+                    print(f"Maintenance task {name} failed:", e)
+    database.aio.shutdown()
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(TASKS)
+    unknown = [name for name in names if name not in TASKS]
+    if unknown:
+        sys.exit(f"Unknown tasks: {', '.join(unknown)} (available: {', '.join(TASKS)})")
+    asyncio.run(main(names))
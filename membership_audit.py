@@ -0,0 +1,87 @@
+# membership_audit.py
+import asyncio
+from telegram.error import RetryAfter
+import config
+import database
+from broadcast import retry_after_seconds
+from handlers.utils import JOINED_STATUSES, remember_membership
+from outbound import background_requests
+from ratelimit import TokenBucket
+
+AUDIT_INTERVAL = getattr(config, "AUDIT_INTERVAL", 6 * 3600)
+AUDIT_BATCH_SIZE = getattr(config, "AUDIT_BATCH_SIZE", 200)
+AUDIT_RATE = getattr(config, "AUDIT_RATE", 10)
+AUDIT_CONCURRENCY = getattr(config, "AUDIT_CONCURRENCY", 5)
+AUDIT_MAX_RETRIES = getattr(config, "AUDIT_MAX_RETRIES", 3)
+# سکه‌ای که بابت خروج از کانال پس از دریافت پاداش کسر می‌شود
+LEAVE_PENALTY_COINS = getattr(config, "LEAVE_PENALTY_COINS", 1)
+
+# نام نقطه‌ی ادامه در job_checkpoints
+CHECKPOINT_NAME = "membership_audit"
+
+# جلوگیری از اجرای همزمان دو بازرسی در یک پردازه
+_audit_lock = asyncio.Lock()
+
+async def _membership_status(bot, bucket, row):
+    """
+    وضعیت عضویت یک ردیف joined_channels: True عضو است، False خارج شده و None نامشخص.
+    خطای API (به جز RetryAfter که صبر و تکرار می‌شود) نامشخص حساب می‌شود تا کسی به اشتباه جریمه نشود.
+    """
+    for _ in range(AUDIT_MAX_RETRIES + 1):
+        await bucket.acquire()
+        try:
+            member = await bot.get_chat_member(chat_id=row["channel_username"], user_id=row["user_id"])
+        except RetryAfter as e:
+            bucket.pause(retry_after_seconds(e))
+            continue
+        except Exception:
+            return None
+        joined = member.status in JOINED_STATUSES
+        remember_membership(row["user_id"], row["channel_username"], joined)
+        return joined
+    return None
+
+async def run_membership_audit(bot, batch_size=AUDIT_BATCH_SIZE, rate=AUDIT_RATE, concurrency=AUDIT_CONCURRENCY):
+    """
+    یک دور کامل بازرسی عضویت‌های پرداخت‌شده، از آخرین نقطه‌ی ذخیره‌شده.
+    پس از هر دسته، جریمه‌ی خارج‌شده‌ها در یک تراکنش اعمال و نقطه‌ی ادامه در job_checkpoints ذخیره می‌شود؛
+    با پایان دور نقطه‌ی ادامه صفر می‌شود. خروجی: (تعداد بررسی‌شده، تعداد خارج‌شده)
+    """
+    bucket = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    checked = left = 0
+
+    async def check(row):
+        async with semaphore:
+            return await _membership_status(bot, bucket, row)
+
+    last_id = await database.aio.get_job_checkpoint(CHECKPOINT_NAME)
+    while True:
+        rows = await database.aio.get_paid_joins_batch(last_id, batch_size)
+        if not rows:
+            break
+        statuses = await asyncio.gather(*(check(row) for row in rows))
+        leavers = [row for row, joined in zip(rows, statuses) if joined is False]
+        checked += len(rows)
+        left += await database.aio.apply_leaver_penalties(leavers, LEAVE_PENALTY_COINS)
+        last_id = rows[-1]["id"]
+        await database.aio.set_job_checkpoint(CHECKPOINT_NAME, last_id)
+
+    await database.aio.set_job_checkpoint(CHECKPOINT_NAME, 0)
+    return checked, left
+
+async def membership_audit_job(context):
+    """job دوره‌ای بازرسی عضویت"""
+    if _audit_lock.locked():
+        return
+    async with _audit_lock:
+        with background_requests():
+            checked, left = await run_membership_audit(context.bot)
+    print(f"Membership audit finished: {checked} checked, {left} left")
+
+def register_membership_audit_job(app):
+    """ثبت job بازرسی دوره‌ای عضویت روی job_queue"""
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(
+            membership_audit_job, interval=AUDIT_INTERVAL, first=60, name="membership_audit"
+        )
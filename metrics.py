@@ -0,0 +1,201 @@
+# metrics.py
+"""
+هیستوگرام‌های سبک درون‌پردازه‌ای با خروجی متنی Prometheus (مسیر /metrics).
+این ماژول به تلگرام وابسته نیست تا database هم بتواند از آن استفاده کند؛
+پوشش هندلرها و درخواست‌های Bot API در instrumentation.py است.
+"""
+import bisect
+import functools
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import config
+
+METRICS_ENABLED = getattr(config, "METRICS_ENABLED", True)
+# نسبت نمونه‌برداری هر دسته؛ کوئری‌ها سریع و پرتعدادند، پس فقط بخشی از آن‌ها زمان‌سنجی می‌شود
+QUERY_SAMPLE_RATE = getattr(config, "METRICS_QUERY_SAMPLE_RATE", 0.05) if METRICS_ENABLED else 0.0
+HANDLER_SAMPLE_RATE = getattr(config, "METRICS_HANDLER_SAMPLE_RATE", 1.0) if METRICS_ENABLED else 0.0
+API_SAMPLE_RATE = getattr(config, "METRICS_API_SAMPLE_RATE", 1.0) if METRICS_ENABLED else 0.0
+# سقف تعداد سری‌های هر متریک؛ برچسب‌های اضافه در سری "other" جمع می‌شوند
+METRICS_MAX_SERIES = getattr(config, "METRICS_MAX_SERIES", 500)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+_registry = []
+
+def should_sample(rate):
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """هیستوگرام با برچسب؛ observe فقط یک bisect و چند جمع زیر قفل است"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                if len(self._series) >= METRICS_MAX_SERIES:
+                    labels = ("other",) * len(self.labelnames)
+                    series = self._series.get(labels)
+                if series is None:
+                    series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class GaugeFunction:
+    """مقداری که هنگام خواندن /metrics از func گرفته می‌شود (مثلاً شمارنده‌ی commit دیتابیس)"""
+
+    def __init__(self, name, documentation, func, metric_type="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.metric_type = metric_type
+        _registry.append(self)
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception as e:
+            print("Metrics collector error:", e)
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}",
+                f"{self.name} {value}"]
+
+def render():
+    """
+    همه‌ی متریک‌ها در قالب متنی Prometheus.
+    مقادیر فقط مربوط به همین پردازه است (tbot_process_id)؛ با چند worker در سرور WSGI یا در حالت processes
+    هر پردازه شمارنده‌های خودش را دارد و هر درخواست /metrics فقط یکی از آن‌ها را نشان می‌دهد.
+    """
+    lines = [f"# Per-process metrics: values cover only process {os.getpid()}"]
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ==================== متریک‌های مشترک ====================
+db_query_seconds = Histogram("tbot_db_query_seconds", "SQLite query duration (sampled)", ("query",))
+db_query_rows = Histogram("tbot_db_query_rows", "Rows returned or changed per query (sampled)", ("query",), ROW_BUCKETS)
+handler_seconds = Histogram("tbot_handler_seconds", "Handler callback duration", ("handler", "outcome"))
+update_seconds = Histogram("tbot_update_seconds", "Total process_update duration per update")
+bot_api_seconds = Histogram("tbot_bot_api_seconds", "Outbound Bot API request duration", ("method", "outcome"))
+
+GaugeFunction("tbot_process_id", "PID of the process that served this response (metrics are per process)",
+              os.getpid)
+
+for _kind, _rate in (("query", QUERY_SAMPLE_RATE), ("handler", HANDLER_SAMPLE_RATE), ("api", API_SAMPLE_RATE)):
+    GaugeFunction(f"tbot_metrics_sample_rate_{_kind}", f"Sampling rate of {_kind} metrics", lambda rate=_rate: rate)
+
+# ==================== کوئری‌های SQLite ====================
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+@functools.lru_cache(maxsize=1024)
+def query_fingerprint(sql):
+    """متن نرمال‌شده‌ی کوئری: فاصله‌ها یکی و عددها و رشته‌های ثابت با ? جایگزین می‌شوند"""
+    return _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip()[:120]
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    cursor نمونه‌برداری‌شده: زمان execute به اضافه‌ی زمان خواندن نتیجه و تعداد ردیف‌ها ثبت می‌شود.
+    کوئری نوشتنی بلافاصله ثبت می‌شود و کوئری خواندنی با fetch*، پایان پیمایش، execute بعدی یا close.
+    """
+    _pending = None
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            fingerprint = query_fingerprint(pending[0])
+            db_query_seconds.observe(pending[1], fingerprint)
+            db_query_rows.observe(pending[2], fingerprint)
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        if self._pending is not None:
+            self._pending[1] += time.perf_counter() - started
+            self._pending[2] += len(result) if isinstance(result, list) else int(result is not None)
+            self._finish()
+        return result
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        self._pending = [sql, elapsed, 0]
+        if self.description is None:
+            self._pending[2] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._pending = [sql, time.perf_counter() - started, max(self.rowcount, 0)]
+        self._finish()
+        return self
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[1] += time.perf_counter() - started
+            self._pending[2] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
@@ -0,0 +1,152 @@
+# outbound.py
+"""
+زمان‌بند درخواست‌های خروجی Bot API زیر bot_app.bot (همه‌ی reply_text، get_chat_member، پیام‌های مدیر و jobها):
+  - یک سطل توکن سراسری (حدود ۳۰ درخواست در ثانیه‌ی تلگرام) با دو صف اولویت:
+    پاسخ به کاربران (interactive) همیشه پیش از درخواست‌های jobهای پس‌زمینه (background) آزاد می‌شود.
+  - سطل جداگانه برای هر چت در متدهای ارسال و ویرایش پیام (۱ پیام در ثانیه در چت خصوصی، ۲۰ در دقیقه در گروه و کانال).
+  - پاسخ 429 به جای خطا: سطل سراسری (و سطل همان چت) به اندازه‌ی retry_after متوقف و درخواست دوباره فرستاده می‌شود؛
+    flood wait تلگرام برای کل ربات است، نه فقط همان چت.
+  - فراخوانی‌های همزمان getChatMember با (چت، کاربر) یکسان در یک درخواست واقعی ادغام می‌شوند.
+اولویت از contextvar خوانده می‌شود؛ jobها بدنه‌ی خود را داخل background_requests() اجرا می‌کنند.
+"""
+import asyncio
+import contextlib
+import contextvars
+import json
+from collections import Counter
+from telegram.request import BaseRequest, HTTPXRequest
+import config
+import metrics
+from cache import TTLCache
+from ratelimit import PriorityTokenBucket, TokenBucket
+
+OUTBOUND_SCHEDULER_ENABLED = getattr(config, "OUTBOUND_SCHEDULER_ENABLED", True)
+# نرخ به اضافه‌ی ظرفیت سطل، سقف درخواست‌ها در هر پنجره‌ی یک‌ثانیه‌ای است (۳۰ در تلگرام)
+OUTBOUND_GLOBAL_RATE = getattr(config, "OUTBOUND_GLOBAL_RATE", 25)
+OUTBOUND_GLOBAL_BURST = getattr(config, "OUTBOUND_GLOBAL_BURST", 5)
+OUTBOUND_PRIVATE_CHAT_RATE = getattr(config, "OUTBOUND_PRIVATE_CHAT_RATE", 1)
+OUTBOUND_PRIVATE_CHAT_BURST = getattr(config, "OUTBOUND_PRIVATE_CHAT_BURST", 3)
+OUTBOUND_GROUP_RATE = getattr(config, "OUTBOUND_GROUP_RATE", 20 / 60)
+OUTBOUND_GROUP_BURST = getattr(config, "OUTBOUND_GROUP_BURST", 3)
+OUTBOUND_MAX_RETRIES = getattr(config, "OUTBOUND_MAX_RETRIES", 3)
+# retry_after بزرگ‌تر از این مقدار (ثانیه) صبر نمی‌شود و RetryAfter به فراخواننده می‌رسد
+OUTBOUND_MAX_RETRY_AFTER = getattr(config, "OUTBOUND_MAX_RETRY_AFTER", 30)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+request_priority = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+# متدهایی که محدودیت پیام هر چت را دارند
+CHAT_LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+# متدهایی که از هیچ سطلی عبور نمی‌کنند (راه‌اندازی و وب‌هوک)
+UNLIMITED_METHODS = frozenset({"getMe", "getUpdates", "setWebhook", "deleteWebhook", "getWebhookInfo",
+                               "close", "logOut"})
+
+outbound_stats = Counter()
+
+@contextlib.contextmanager
+def background_requests():
+    """اجرای درخواست‌های Bot API داخل این بلوک (و taskهای ساخته‌شده در آن) با اولویت پس‌زمینه"""
+    token = request_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+def _retry_after(payload):
+    """مقدار parameters.retry_after پاسخ 429 (ثانیه) یا None"""
+    try:
+        parameters = json.loads(payload).get("parameters") or {}
+        return float(parameters["retry_after"])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+def _is_group_chat(chat_id):
+    # شناسه‌ی منفی (گروه، سوپرگروه و کانال) یا @username کانال
+    if isinstance(chat_id, str):
+        return chat_id.startswith("-") or not chat_id.isdigit()
+    return chat_id < 0
+
+class ScheduledRequest(BaseRequest):
+    """پوشش یک BaseRequest (پیش‌فرض HTTPXRequest) که همه‌ی درخواست‌ها را از زمان‌بند عبور می‌دهد"""
+
+    def __init__(self, request=None, global_rate=OUTBOUND_GLOBAL_RATE, max_retries=OUTBOUND_MAX_RETRIES):
+        self._request = request if request is not None else HTTPXRequest(connection_pool_size=256)
+        self.max_retries = max_retries
+        self._global = PriorityTokenBucket(global_rate, min(OUTBOUND_GLOBAL_BURST, global_rate))
+        self._chat_buckets = TTLCache(maxsize=50000, ttl=300)
+        # درخواست‌های getChatMember در حال اجرا: (چت، کاربر) -> task
+        self._in_flight = {}
+
+    @property
+    def read_timeout(self):
+        return getattr(self._request, "read_timeout", None)
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def shutdown(self):
+        await self._request.shutdown()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if _is_group_chat(chat_id):
+                bucket = TokenBucket(OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST)
+            else:
+                bucket = TokenBucket(OUTBOUND_PRIVATE_CHAT_RATE, OUTBOUND_PRIVATE_CHAT_BURST)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        args = (url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout)
+        api_method = url.rsplit("/", 1)[-1]
+        parameters = request_data.parameters if request_data is not None else {}
+        if api_method != "getChatMember":
+            return await self._send(api_method, parameters, args)
+
+        key = (parameters.get("chat_id"), parameters.get("user_id"))
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._send(api_method, parameters, args))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _, key=key: self._in_flight.pop(key, None))
+        else:
+            outbound_stats["coalesced"] += 1
+        # لغو یک فراخواننده نباید درخواست مشترک بقیه را لغو کند
+        return await asyncio.shield(task)
+
+    async def _send(self, api_method, parameters, args):
+        chat_bucket = None
+        if api_method.startswith(CHAT_LIMITED_PREFIXES) and parameters.get("chat_id") is not None:
+            chat_bucket = self._chat_bucket(parameters["chat_id"])
+        limited = api_method not in UNLIMITED_METHODS
+        priority = request_priority.get()
+
+        for attempt in range(self.max_retries + 1):
+            # اول نوبت چت، بعد توکن سراسری؛ تا انتظار یک چت پرترافیک سهم بقیه را نگه ندارد
+            if chat_bucket is not None:
+                await chat_bucket.acquire()
+            if limited:
+                await self._global.acquire(priority=priority)
+            outbound_stats["requests"] += 1
+            code, payload = await self._request.do_request(*args)
+            if code != 429:
+                return code, payload
+            outbound_stats["throttled"] += 1
+            delay = _retry_after(payload)
+            if delay is None or delay > OUTBOUND_MAX_RETRY_AFTER or attempt >= self.max_retries:
+                # BaseRequest از همین پاسخ RetryAfter می‌سازد
+                return code, payload
+            outbound_stats["retries"] += 1
+            # flood wait تلگرام برای کل ربات است؛ درخواست‌های چت‌های دیگر هم تا پایان آن فرستاده نمی‌شوند
+            self._global.pause(delay)
+            if chat_bucket is not None:
+                chat_bucket.pause(delay)
+
+for _name in ("requests", "throttled", "retries", "coalesced"):
+    metrics.GaugeFunction(f"tbot_outbound_{_name}_total", f"Outbound Bot API scheduler {_name}",
+                          lambda name=_name: outbound_stats[name], metric_type="counter")
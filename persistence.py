@@ -0,0 +1,184 @@
+# persistence.py
+"""
+ماندگاری user_data و وضعیت ConversationHandlerها در همان دیتابیس SQLite،
+تا با راه‌اندازی مجدد یا جایگزینی worker کاربران از وسط گفتگوها (خرید سکه، افزودن عضو، پاسخ مدیر) بیرون نیفتند.
+- user_data هر کاربر تنبل بارگذاری می‌شود: هنگام راه‌اندازی چیزی خوانده نمی‌شود و اولین آپدیت هر کاربر
+  در گروه -1 داده‌ی ذخیره‌شده‌ی همان کاربر را به context.user_data اضافه می‌کند.
+- PTB هر update_interval ثانیه update_* را برای کاربران تغییرکرده صدا می‌زند؛ این‌جا فقط pickle و مقایسه‌ی
+  hash انجام می‌شود و تغییرات واقعی کمی بعد در یک تراکنش روی رشته‌ی نویسنده‌ی database.aio نوشته می‌شوند.
+- فقط گفتگوهای باز ذخیره می‌شوند (پایان گفتگو ردیف را حذف می‌کند)، پس بارگذاری آن‌ها هنگام شروع کوچک است.
+"""
+import asyncio
+import json
+import pickle
+from telegram import Update
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput, TypeHandler
+import config
+import database
+
+PERSISTENCE_ENABLED = getattr(config, "PERSISTENCE_ENABLED", True)
+PERSISTENCE_UPDATE_INTERVAL = getattr(config, "PERSISTENCE_UPDATE_INTERVAL", 5)
+# فاصله‌ی کوتاه برای جمع شدن همه‌ی update_*های یک دور در یک تراکنش
+PERSISTENCE_FLUSH_DELAY = 0.05
+
+def _dumps(value):
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _conversation_key(key):
+    # کلید گفتگو تاپلی از شناسه‌هاست (چت، کاربر و ...)
+    return json.dumps(list(key))
+
+class SQLitePersistence(BasePersistence):
+    """persistence مبتنی بر جدول‌های persisted_user_data و persisted_conversations"""
+
+    def __init__(self, update_interval=PERSISTENCE_UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        # کاربرانی که داده‌شان در این پردازه بارگذاری شده؛ فقط برای آن‌ها نوشتن مجاز است
+        # تا user_data خالی یک کاربر بارگذاری‌نشده داده‌ی ذخیره‌شده را پاک نکند
+        self._loaded_users = set()
+        self._saved_hashes = {}
+        self._dirty_users = {}
+        self._dirty_conversations = {}
+        self._flush_task = None
+
+    # ---------- بارگذاری تنبل ----------
+    async def load_user(self, update, context):
+        """هندلر گروه -1: بارگذاری user_data ذخیره‌شده در اولین آپدیت هر کاربر"""
+        user = update.effective_user
+        if user is None or user.id in self._loaded_users:
+            return
+        blob = await database.aio.get_persisted_user_data(user.id)
+        if user.id in self._loaded_users:
+            return
+        self._saved_hashes[user.id] = hash(blob)
+        if blob is not None:
+            for key, value in pickle.loads(blob).items():
+                context.user_data.setdefault(key, value)
+        self._loaded_users.add(user.id)
+
+    # ---------- user_data ----------
+    async def get_user_data(self):
+        return {}
+
+    async def update_user_data(self, user_id, data):
+        if user_id not in self._loaded_users:
+            return
+        blob = _dumps(dict(data)) if data else None
+        digest = hash(blob)
+        if self._saved_hashes.get(user_id) == digest:
+            return
+        self._saved_hashes[user_id] = digest
+        self._dirty_users[user_id] = blob
+        self._schedule_flush()
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self._saved_hashes[user_id] = hash(None)
+        self._dirty_users[user_id] = None
+        self._schedule_flush()
+
+    # ---------- گفتگوها ----------
+    async def get_conversations(self, name):
+        rows = await database.aio.get_persisted_conversations(name)
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        self._dirty_conversations[(name, _conversation_key(key))] = None if new_state is None else _dumps(new_state)
+        self._schedule_flush()
+
+    # ---------- داده‌هایی که ذخیره نمی‌شوند ----------
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+    # ---------- نوشتن دسته‌ای ----------
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(PERSISTENCE_FLUSH_DELAY)
+        await self._write_dirty()
+
+    async def _write_dirty(self):
+        user_data, self._dirty_users = self._dirty_users, {}
+        conversations, self._dirty_conversations = self._dirty_conversations, {}
+        if not user_data and not conversations:
+            return
+        try:
+            await database.aio.save_persistence_batch(user_data, conversations)
+        except Exception as e:
+            print("Persistence flush error:", e)
+            # تغییرات جدیدتر (در حین نوشتن) بر نسخه‌ی ناموفق اولویت دارند
+            self._dirty_users = {**user_data, **self._dirty_users}
+            self._dirty_conversations = {**conversations, **self._dirty_conversations}
+            for user_id in user_data:
+                self._saved_hashes.pop(user_id, None)
+
+    async def flush(self):
+        """هنگام خاموش شدن bot_app: نوشتن همه‌ی تغییرات باقیمانده"""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self._write_dirty()
+
+def _conversation_name(handler, used):
+    """نام پایدار گفتگو از callback اولین entry point (در همه‌ی deployها یکسان است)"""
+    callback = getattr(handler.entry_points[0], "callback", None) if handler.entry_points else None
+    base = f"{callback.__module__}.{callback.__qualname__}" if callback is not None else "conversation"
+    name, index = base, 1
+    while name in used:
+        index += 1
+        name = f"{base}#{index}"
+    return name
+
+def make_conversations_persistent(application):
+    """
+    ماندگار کردن ConversationHandlerهای سطح بالا که با persistent=False ساخته شده‌اند.
+    هندلرها در ماژول‌های handlers ساخته می‌شوند؛ به جای تغییر همه‌ی آن‌ها پرچم‌ها پیش از initialize تنظیم می‌شوند.
+    """
+    conversations = [handler for handlers in application.handlers.values() for handler in handlers
+                     if isinstance(handler, ConversationHandler)]
+    used = {handler.name for handler in conversations if handler.name}
+    for handler in conversations:
+        if handler.persistent:
+            continue
+        if not hasattr(handler, "_persistent") or not hasattr(handler, "_name"):
+            print("Persistence: unsupported ConversationHandler version; conversation state is not persisted")
+            return
+        if handler.name is None:
+            handler._name = _conversation_name(handler, used)
+        handler._persistent = True
+        used.add(handler.name)
+
+def register_persistence(application, persistence):
+    """بارگذاری تنبل user_data در گروه -1 و ماندگار کردن گفتگوها؛ پس از ثبت همه‌ی هندلرها فراخوانی شود"""
+    make_conversations_persistent(application)
+    application.add_handler(TypeHandler(Update, persistence.load_user), group=-1)
@@ -0,0 +1,89 @@
+# ratelimit.py
+import asyncio
+import heapq
+import itertools
+import time
+
+class TokenBucket:
+    """
+    سطل توکن ناهمگام: به طور میانگین حداکثر rate درخواست در ثانیه و حداکثر capacity درخواست پشت سر هم.
+    با pause می‌توان همه‌ی منتظرها را برای مدتی متوقف کرد (مثلاً پس از خطای RetryAfter تلگرام).
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def try_acquire(self, tokens=1):
+        """گرفتن توکن بدون انتظار؛ False یعنی فعلاً توکن کافی نیست"""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def pause(self, seconds):
+        """خالی کردن سطل به اندازه‌ای که تا seconds ثانیه‌ی دیگر توکنی آزاد نشود"""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+class PriorityTokenBucket(TokenBucket):
+    """
+    سطل توکنی که منتظرها را به ترتیب اولویت (عدد کمتر = مهم‌تر) و در هر اولویت به ترتیب ورود آزاد می‌کند؛
+    مثلاً پاسخ به کاربران پیش از پیام‌های همگانی. فقط از داخل حلقه‌ی رویداد استفاده شود.
+    """
+
+    def __init__(self, rate, capacity=None):
+        super().__init__(rate, capacity)
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer = None
+
+    async def acquire(self, tokens=1, priority=0):
+        if not self._waiters and self.try_acquire(tokens):
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), tokens, future))
+        # اگر زمان‌سنج فعال باشد توکنی آزاد نیست و همان زمان‌سنج صف را جلو می‌برد
+        if self._timer is None:
+            self._drain()
+        await future
+
+    def pause(self, seconds):
+        super().pause(seconds)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._waiters:
+            self._drain()
+
+    def _drain(self):
+        self._timer = None
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self.try_acquire(tokens):
+                delay = (tokens - self._tokens) / self.rate
+                self._timer = asyncio.get_running_loop().call_later(delay, self._drain)
+                return
+            heapq.heappop(self._waiters)
+            future.set_result(None)
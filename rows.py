@@ -0,0 +1,88 @@
+# rows.py
+"""
+ردیف‌های فشرده به جای dict_factory در مسیرهای پرتکرار خواندن.
+کلاس‌ها زیرکلاس sqlite3.Row هستند: هر ردیف فقط تاپل مقدارها و یک ارجاع به cursor.description
+(که بین همه‌ی ردیف‌های یک کوئری مشترک است) را نگه می‌دارد و ساختن و row["col"] آن در C انجام می‌شود؛
+بنابراین برای هر ردیف هیچ dict و هیچ نگاشت ستونی ساخته نمی‌شود.
+رابط آن مثل dict است: row["col"]، row.get، keys/values/items، in، len، dict(row)، copy و مقایسه با dict؛
+علاوه بر آن row.col هم کار می‌کند. ردیف‌ها فقط‌خواندنی‌اند؛ برای تغییر از row.copy() استفاده کنید.
+اما dict نیستند: isinstance(row, dict) برقرار نیست، json.dumps(row) خطا می‌دهد و مقداردهی row["col"] ممکن نیست.
+پس فقط در خواندن‌های چندردیفی داخلی (فیدهای سفارش، بازرسی عضویت، iter_keyset) استفاده می‌شوند؛ توابعی که
+ردیف را به هندلرها برای تغییر یا تبدیل به JSON می‌دهند (مثل get_user، search_users و get_coin_order) dict برمی‌گردانند.
+"""
+import sqlite3
+
+class Row(sqlite3.Row):
+    """ردیف فقط‌خواندنی با رابط dict؛ خود کلاس به عنوان row_factory روی cursor قرار می‌گیرد"""
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (IndexError, KeyError):
+            return default
+
+    def values(self):
+        return tuple(self[index] for index in range(len(self)))
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def copy(self):
+        """مثل dict.copy؛ خروجی یک dict معمولی و قابل تغییر است"""
+        return dict(zip(self.keys(), self.values()))
+
+    def __iter__(self):
+        # مثل dict روی نام ستون‌ها (sqlite3.Row به تنهایی روی مقدارها پیمایش می‌کند)
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except (IndexError, KeyError):
+            raise AttributeError(name) from None
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, Row)):
+            return self.copy() == (other if isinstance(other, dict) else other.copy())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # sqlite3.Row بدون cursor ساخته نمی‌شود؛ در pickle (مثلاً persistence) به dict تبدیل می‌شود
+        return (dict, (self.items(),))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.copy()!r})"
+
+class UserRow(Row):
+    """ردیف جدول users"""
+    __slots__ = ()
+
+class SubscriberOrderRow(Row):
+    """ردیف جدول subscriber_orders (به همراه ستون‌های محاسبه‌شده مثل weight)"""
+    __slots__ = ()
+
+class JoinedChannelRow(Row):
+    """ردیف جدول joined_channels"""
+    __slots__ = ()
+
+class CoinOrderRow(Row):
+    """ردیف جدول coin_orders"""
+    __slots__ = ()
+
+# کلاس ردیف هر جدول برای توابع عمومی مثل iter_keyset
+ROW_CLASSES = {
+    "users": UserRow,
+    "subscriber_orders": SubscriberOrderRow,
+    "joined_channels": JoinedChannelRow,
+    "coin_orders": CoinOrderRow,
+}
@@ -0,0 +1,57 @@
+# tests/conftest.py
+"""
+پیکربندی مشترک تست‌ها: هر تست یک config موقت با دیتابیس تازه در tmp_path و نسخه‌ی تازه‌ی ماژول database می‌گیرد،
+پس به دیتابیس اصلی دست زده نمی‌شود و وضعیت ماژول (اتصال هر رشته، کش‌ها، بافر نوشتن) بین تست‌ها مشترک نیست.
+"""
+import glob
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def _module_path(name):
+    """مسیر فایل ماژول؛ در نبود name.py اولین name*.py ریشه‌ی مخزن (مثل bench_webhook)"""
+    path = os.path.join(ROOT, f"{name}.py")
+    if os.path.exists(path):
+        return path
+    return sorted(glob.glob(os.path.join(ROOT, f"{name}*.py")))[0]
+
+def make_config(db_path, **settings):
+    config = types.ModuleType("config")
+    config.DATABASE_NAME = str(db_path)
+    config.INITIAL_COINS = 0
+    config.ADMIN_ID = 0
+    config.BOT_TOKEN = "0:test"
+    for name, value in settings.items():
+        setattr(config, name, value)
+    return config
+
+def load_module(monkeypatch, name):
+    """import تازه‌ی ماژول name از ریشه‌ی مخزن (با config فعلی sys.modules)"""
+    spec = importlib.util.spec_from_file_location(name, _module_path(name))
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, name, module)
+    spec.loader.exec_module(module)
+    return module
+
+def load_database(monkeypatch, db_path, **settings):
+    """import تازه‌ی ماژول database با config موقت و اجرای مهاجرت‌ها"""
+    monkeypatch.setitem(sys.modules, "config", make_config(db_path, **settings))
+    module = load_module(monkeypatch, "database")
+    module.init_db()
+    return module
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    module = load_database(monkeypatch, tmp_path / "test.db")
+    yield module
+    if module._write_behind is not None:
+        module.disable_write_behind()
+    module.aio.shutdown()
+    module.close_connection()
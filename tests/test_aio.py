@@ -0,0 +1,16 @@
+# tests/test_aio.py
+import asyncio
+
+import pytest
+
+def test_aio_runs_helpers_off_the_event_loop(database):
+    async def main():
+        await database.aio.add_user(1, "0900", 5)
+        return await database.aio.get_user(1)
+
+    assert asyncio.run(main())["coin_balance"] == 5
+
+@pytest.mark.parametrize("name", ["get_connection", "get_db_connection", "close_connection"])
+def test_aio_does_not_expose_connection_factories(database, name):
+    with pytest.raises(AttributeError):
+        getattr(database.aio, name)
@@ -0,0 +1,35 @@
+# tests/test_archive.py
+"""
+عضویت‌های بایگانی‌شده (archive_batch) برای بررسی‌های عضویت و بازرسی خروج مثل ردیف‌های جدول اصلی رفتار می‌کنند.
+"""
+COLLECTOR_ID = 1
+OWNER_ID = 2
+
+def archive_all_joins(database):
+    conn = database.get_connection()
+    conn.execute("UPDATE joined_channels SET created_at = datetime('now', '-200 days')")
+    conn.commit()
+    assert database.archive_batch("joined_channels", 30) > 0
+    assert conn.execute("SELECT COUNT(*) AS n FROM joined_channels").fetchone()["n"] == 0
+
+def test_archived_forced_join_is_still_recognised(database):
+    database.add_joined_channel(COLLECTOR_ID, "@forced", "forced")
+    archive_all_joins(database)
+    assert database.is_user_joined_forced_channel(COLLECTOR_ID, "@forced")
+    assert not database.is_user_joined_forced_channel(COLLECTOR_ID, "@other")
+
+def test_archived_paid_join_is_still_audited(database):
+    database.add_user(COLLECTOR_ID, "0900", 10)
+    order_id = database.create_subscriber_order(OWNER_ID, "@archived", 10)
+    assert database.credit_collector(COLLECTOR_ID, order_id, "@archived", 1)
+    archive_all_joins(database)
+    order_id = database.create_subscriber_order(OWNER_ID, "@live", 10)
+    assert database.credit_collector(COLLECTOR_ID, order_id, "@live", 1)
+
+    rows = database.get_paid_joins_batch(0, 10)
+    assert [row["channel_username"] for row in rows] == ["@archived", "@live"]
+    assert database.get_paid_joins_batch(rows[0]["id"], 10)[0]["channel_username"] == "@live"
+
+    assert database.apply_leaver_penalties(rows[:1], 1) == 1
+    assert database.apply_leaver_penalties(rows[:1], 1) == 0
+    assert [row["channel_username"] for row in database.get_paid_joins_batch(0, 10)] == ["@live"]
@@ -0,0 +1,56 @@
+# tests/test_broadcast_claim.py
+"""
+هر پیام همگانی فقط توسط یک مالک ارسال می‌شود (claim_broadcast) و پس از پایان اجاره‌ی مالک از کار افتاده
+قابل ادامه است.
+"""
+import threading
+
+def expire_lease(database, broadcast_id):
+    conn = database.get_connection()
+    conn.execute("UPDATE broadcasts SET lease_until = datetime('now', '-1 seconds') WHERE broadcast_id = ?",
+                 (broadcast_id,))
+    conn.commit()
+
+def test_only_one_concurrent_claim_wins(database):
+    broadcast_id = database.create_broadcast(0, "hello")
+    barrier = threading.Barrier(20)
+    results = []
+
+    def claim(owner):
+        barrier.wait()
+        results.append(database.claim_broadcast(broadcast_id, owner, 300))
+        database.close_connection()
+
+    threads = [threading.Thread(target=claim, args=(f"worker-{i}",)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+
+def test_progress_requires_lease_and_extends_it(database):
+    broadcast_id = database.create_broadcast(0, "hello")
+    assert database.claim_broadcast(broadcast_id, "a", 300)
+    assert not database.claim_broadcast(broadcast_id, "b", 300)
+    assert not database.update_broadcast_progress(broadcast_id, 10, 5, 0, owner="b", lease_seconds=300)
+    assert database.update_broadcast_progress(broadcast_id, 10, 5, 0, owner="a", lease_seconds=300)
+    broadcast = database.get_broadcast(broadcast_id)
+    assert (broadcast["last_user_id"], broadcast["sent"], broadcast["owner"]) == (10, 5, "a")
+
+def test_expired_or_released_lease_can_be_taken_over(database):
+    broadcast_id = database.create_broadcast(0, "hello")
+    assert database.claim_broadcast(broadcast_id, "crashed", 300)
+    expire_lease(database, broadcast_id)
+    assert database.claim_broadcast(broadcast_id, "b", 300)
+    # مالک قبلی دیگر نمی‌تواند پیشرفت ثبت کند
+    assert not database.update_broadcast_progress(broadcast_id, 10, 5, 0, owner="crashed", lease_seconds=300)
+
+    database.release_broadcast(broadcast_id, "b")
+    assert database.claim_broadcast(broadcast_id, "c", 300)
+
+def test_finished_broadcast_cannot_be_claimed(database):
+    broadcast_id = database.create_broadcast(0, "hello")
+    assert database.claim_broadcast(broadcast_id, "a", 300)
+    database.finish_broadcast(broadcast_id)
+    assert database.get_broadcast(broadcast_id)["owner"] is None
+    assert not database.claim_broadcast(broadcast_id, "b", 300)
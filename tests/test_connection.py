@@ -0,0 +1,20 @@
+# tests/test_connection.py
+import sqlite3
+
+import pytest
+
+def test_failed_helper_transaction_is_not_committed_by_next_helper(database):
+    database.add_user(1, "0900", 0)
+    conn = database.get_connection()
+    conn.execute("INSERT INTO subscriber_orders (user_id, channel_username, required) VALUES (1, '@half', 10)")
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("UPDATE missing_table SET x = 1")
+    # تابع بعدی روی همان اتصال رشته commit می‌کند
+    database.ban_user(1)
+
+    conn = database.get_connection()
+    assert conn.execute("SELECT COUNT(*) AS n FROM subscriber_orders").fetchone()["n"] == 0
+    assert database.get_user(1)["banned"] == 1
+
+def test_connection_is_reused_per_thread(database):
+    assert database.get_connection() is database.get_connection()
@@ -0,0 +1,54 @@
+# tests/test_credit_collector.py
+import threading
+
+THREADS = 200
+ATTEMPTS = 3
+SLOTS = 50
+REWARD = 1.5
+FIRST_USER_ID = 1000
+
+def test_credit_collector_never_overfills_under_concurrency(database):
+    conn = database.get_connection()
+    conn.executemany("INSERT INTO users (user_id, phone, coin_balance) VALUES (?, '', 0)",
+                     [(FIRST_USER_ID + i,) for i in range(THREADS)])
+    conn.commit()
+    order_id = database.create_subscriber_order(1, "@hammer", SLOTS)
+
+    barrier = threading.Barrier(THREADS)
+    results = []
+    errors = []
+
+    def collect(user_id):
+        try:
+            barrier.wait()
+            for _ in range(ATTEMPTS):
+                results.append(database.credit_collector(user_id, order_id, "@hammer", REWARD))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            database.close_connection()
+
+    threads = [threading.Thread(target=collect, args=(FIRST_USER_ID + i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(results) == THREADS * ATTEMPTS
+    assert results.count(True) == SLOTS
+
+    conn = database.get_connection()
+    order = conn.execute("SELECT current, required FROM subscriber_orders WHERE order_id = ?", (order_id,)).fetchone()
+    assert order["current"] == order["required"] == SLOTS
+    joins = conn.execute("SELECT COUNT(*) AS n, COUNT(DISTINCT user_id) AS users FROM joined_channels "
+                         "WHERE channel_username = '@hammer'").fetchone()
+    assert joins["n"] == joins["users"] == SLOTS
+    transactions = conn.execute("SELECT COUNT(*) AS n, SUM(amount) AS total FROM transactions "
+                                "WHERE type = 'join_reward'").fetchone()
+    assert transactions["n"] == SLOTS
+    assert transactions["total"] == SLOTS * REWARD
+    balances = conn.execute("SELECT SUM(coin_balance + coin_fraction) AS total, "
+                            "SUM(coin_balance + coin_fraction > 0) AS paid FROM users").fetchone()
+    assert balances["total"] == SLOTS * REWARD
+    assert balances["paid"] == SLOTS
@@ -0,0 +1,18 @@
+# tests/test_job_checkpoints.py
+"""
+نقطه‌ی ادامه‌ی jobها نسخه‌ی تنظیمات را عوض نمی‌کند تا کش تنظیمات پردازه‌ها با هر دسته بی‌اعتبار نشود.
+"""
+
+def settings_version(database):
+    row = database.get_connection().execute(
+        "SELECT value FROM settings WHERE key = ?", (database.SETTINGS_VERSION_KEY,)).fetchone()
+    return row["value"] if row else None
+
+def test_checkpoint_does_not_bump_settings_version(database):
+    database.set_setting("welcome_message", "hi")
+    version = settings_version(database)
+    assert database.get_job_checkpoint("membership_audit") == 0
+    for last_id in (200, 400, 0):
+        database.set_job_checkpoint("membership_audit", last_id)
+        assert database.get_job_checkpoint("membership_audit") == last_id
+    assert settings_version(database) == version
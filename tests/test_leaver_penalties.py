@@ -0,0 +1,32 @@
+# tests/test_leaver_penalties.py
+"""
+جریمه‌ی خروج از کانال ردیف عضویت را نگه می‌دارد تا همان کانال دوباره در فید ظاهر نشود و دوباره پاداش نگیرد.
+"""
+import pytest
+
+COLLECTOR_ID = 1
+OWNER_ID = 2
+
+@pytest.fixture
+def paid_join(database):
+    database.add_user(COLLECTOR_ID, "0900", 10)
+    database.add_user(OWNER_ID, "0901", 0)
+    order_id = database.create_subscriber_order(OWNER_ID, "@channel", 10)
+    assert database.credit_collector(COLLECTOR_ID, order_id, "@channel", 1)
+    [row] = database.get_paid_joins_batch(0, 10)
+    return row
+
+def test_penalty_is_applied_once(database, paid_join):
+    assert database.apply_leaver_penalties([paid_join], 1) == 1
+    assert database.apply_leaver_penalties([paid_join], 1) == 0
+    assert database.get_user_warnings(COLLECTOR_ID) == 1
+    assert database.get_paid_joins_batch(0, 10) == []
+
+def test_leaver_cannot_collect_the_same_channel_again(database, paid_join):
+    database.apply_leaver_penalties([paid_join], 1)
+    assert database.user_has_joined_channel(COLLECTOR_ID, "@channel")
+    assert database.get_recent_orders(COLLECTOR_ID) == []
+
+    # سفارش تازه برای همان کانال هم به جمع‌کننده‌ی خارج‌شده پاداش نمی‌دهد
+    order_id = database.create_subscriber_order(OWNER_ID, "@channel", 10)
+    assert not database.credit_collector(COLLECTOR_ID, order_id, "@channel", 1)
@@ -0,0 +1,44 @@
+# tests/test_membership_cache.py
+"""
+is_channel_member با use_cache=False همیشه از Bot API می‌پرسد (نتیجه‌ی مثبت کش‌شده هم نادیده گرفته می‌شود).
+"""
+import asyncio
+import types
+
+import pytest
+
+from conftest import load_module
+
+pytest.importorskip("telegram")
+
+class FakeBot:
+    def __init__(self, status):
+        self.status = status
+        self.calls = 0
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls += 1
+        return types.SimpleNamespace(status=self.status)
+
+@pytest.fixture
+def utils(database, monkeypatch):
+    return load_module(monkeypatch, "utils")
+
+def test_use_cache_false_bypasses_cached_membership(utils):
+    bot = FakeBot("member")
+    context = types.SimpleNamespace(bot=bot)
+    check = lambda **kwargs: asyncio.run(utils.is_channel_member(context, "@forced", 7, **kwargs))
+
+    assert check() is True
+    bot.status = "left"
+    # نتیجه‌ی مثبت تا پایان TTL از کش خوانده می‌شود
+    assert check() is True
+    assert bot.calls == 1
+    # بررسی تازه خروج کاربر را می‌بیند و کش را به‌روز می‌کند
+    assert check(use_cache=False) is False
+    assert check() is False
+    assert bot.calls == 2
+
+    bot.status = "member"
+    assert check(use_cache=False) is True
+    assert bot.calls == 3
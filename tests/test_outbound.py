@@ -0,0 +1,130 @@
+# tests/test_outbound.py
+"""
+زمان‌بند خروجی (outbound.ScheduledRequest) در برابر سرور محلی benchmarks/fake_bot_api:
+ادغام getChatMember، لغو یک فراخواننده، صف اولویت و تلاش مجدد پس از 429.
+"""
+import asyncio
+import json
+import os
+import sys
+import types
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import ROOT, load_module, make_config
+
+pytest.importorskip("telegram")
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+from fake_bot_api import FakeBotAPI
+
+class UrllibRequest:
+    """درخواست داخلی ساده (به جای HTTPXRequest) که متدها را به ترتیب رسیدن در calls ثبت می‌کند"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *timeouts):
+        parameters = request_data.parameters if request_data is not None else {}
+        self.calls.append((url.rsplit("/", 1)[-1], parameters.get("chat_id")))
+        return await asyncio.to_thread(self._post, url, parameters)
+
+    @staticmethod
+    def _post(url, parameters):
+        request = urllib.request.Request(url, data=json.dumps(parameters).encode(),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+@pytest.fixture
+def outbound(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "config", make_config(tmp_path / "test.db", METRICS_ENABLED=False))
+    return load_module(monkeypatch, "outbound")
+
+@pytest.fixture
+def server():
+    api = FakeBotAPI(latency=0.1).start()
+    yield api
+    api.stop()
+
+def call(scheduler, server, method, **parameters):
+    return scheduler.do_request(f"{server.base_url}/{method}", "POST", types.SimpleNamespace(parameters=parameters))
+
+def test_concurrent_get_chat_member_calls_are_coalesced(outbound, server):
+    scheduler = outbound.ScheduledRequest(UrllibRequest())
+
+    async def main():
+        return await asyncio.gather(*(call(scheduler, server, "getChatMember", chat_id="@forced", user_id=7)
+                                      for _ in range(20)))
+
+    results = asyncio.run(main())
+    assert {code for code, _ in results} == {200}
+    assert server.calls["getChatMember"] == 1
+
+def test_cancelling_one_waiter_keeps_the_shared_request(outbound, server):
+    scheduler = outbound.ScheduledRequest(UrllibRequest())
+
+    async def main():
+        first = asyncio.create_task(call(scheduler, server, "getChatMember", chat_id="@forced", user_id=7))
+        second = asyncio.create_task(call(scheduler, server, "getChatMember", chat_id="@forced", user_id=7))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    code, _ = asyncio.run(main())
+    assert code == 200
+    assert server.calls["getChatMember"] == 1
+
+def test_interactive_request_jumps_ahead_of_background_queue(outbound, server):
+    server.latency = 0
+    inner = UrllibRequest()
+    scheduler = outbound.ScheduledRequest(inner, global_rate=20)
+    burst = outbound.OUTBOUND_GLOBAL_BURST
+
+    async def main():
+        with outbound.background_requests():
+            background = [asyncio.create_task(call(scheduler, server, "sendMessage", chat_id=1000 + i, text="b"))
+                          for i in range(burst + 5)]
+        # همه‌ی پیام‌های پس‌زمینه یا فرستاده شده‌اند یا در صف سطل سراسری منتظرند
+        await asyncio.sleep(0)
+        await call(scheduler, server, "sendMessage", chat_id=1, text="reply")
+        await asyncio.gather(*background)
+
+    asyncio.run(main())
+    # پس از مصرف ظرفیت اولیه، پاسخ کاربر پیش از بقیه‌ی صف پس‌زمینه فرستاده می‌شود
+    assert inner.calls.index(("sendMessage", 1)) == burst
+
+def test_429_is_retried_after_retry_after_and_pauses_all_chats(outbound, server):
+    server.latency = 0
+    server.max_rate = 1
+    scheduler = outbound.ScheduledRequest(UrllibRequest())
+
+    async def main():
+        assert (await call(scheduler, server, "sendMessage", chat_id=1, text="a"))[0] == 200
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        retried = asyncio.create_task(call(scheduler, server, "sendMessage", chat_id=2, text="b"))
+        await asyncio.sleep(0.2)
+        # flood wait برای کل ربات است: سطل سراسری هم متوقف شده است
+        assert server.throttled == 1
+        assert not scheduler._global.try_acquire()
+        code, _ = await retried
+        return code, loop.time() - started
+
+    code, elapsed = asyncio.run(main())
+    assert code == 200
+    assert elapsed >= server.retry_after
+    assert outbound.outbound_stats["retries"] >= 1
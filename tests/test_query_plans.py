@@ -0,0 +1,66 @@
+# tests/test_query_plans.py
+"""
+کوئری‌های پرتکرار باید از ایندکس‌های مهاجرت‌ها استفاده کنند (EXPLAIN QUERY PLAN).
+کوئری‌ها با set_trace_callback از خود توابع ماژول گرفته می‌شوند تا تست با تغییر SQL همگام بماند.
+"""
+import pytest
+
+COLLECTOR_ID = 1
+
+@pytest.fixture
+def db(database):
+    database.add_user(COLLECTOR_ID, "0900", 0)
+    for i in range(20):
+        database.create_subscriber_order(100 + i, f"@channel_{i}", 10)
+        database.add_joined_channel(COLLECTOR_ID, f"@joined_{i}", "order", i + 1)
+        database.create_coin_order(100 + i, 10, 1000, "file")
+    return database
+
+def traced_selects(database, func, *args):
+    """متن کامل (با مقدار پارامترها) SELECTهایی که func اجرا می‌کند"""
+    conn = database.get_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        func(*args)
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+def query_plan(database, sql):
+    rows = database.get_connection().execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    return " | ".join(row["detail"] for row in rows)
+
+@pytest.mark.parametrize("func_name, args, index", [
+    ("get_weighted_orders", (COLLECTOR_ID,), "idx_subscriber_orders_open_priority"),
+    ("get_recent_orders", (COLLECTOR_ID,), "idx_subscriber_orders_open_created"),
+    ("get_ending_orders", (COLLECTOR_ID,), "idx_subscriber_orders_open_progress"),
+    ("get_random_orders", (COLLECTOR_ID,), "idx_subscriber_orders_open_random"),
+    ("has_active_order", (100, "@channel_0"), "idx_subscriber_orders_open_owner"),
+    ("get_available_coin_orders", (100,), "idx_subscriber_orders_open_owner"),
+])
+def test_order_queries_use_open_order_indexes(db, func_name, args, index):
+    statements = traced_selects(db, getattr(db, func_name), *args)
+    assert statements
+    for sql in statements:
+        plan = query_plan(db, sql)
+        assert index in plan, plan
+        # پیمایش کامل جدول بدون ایندکس
+        assert "SCAN subscriber_orders" not in plan.split(" | "), plan
+
+def test_feed_anti_join_uses_joined_channels_unique_index(db):
+    plan = query_plan(db, traced_selects(db, db.get_recent_orders, COLLECTOR_ID)[0])
+    assert "SEARCH j USING" in plan and "sqlite_autoindex_joined_channels_1" in plan, plan
+
+def test_user_has_joined_channel_uses_unique_index(db):
+    plan = query_plan(db, traced_selects(db, db.user_has_joined_channel, COLLECTOR_ID, "@joined_0")[0])
+    assert "sqlite_autoindex_joined_channels_1" in plan, plan
+
+def test_user_channels_use_owner_index(db):
+    plan = query_plan(db, traced_selects(db, db.get_user_channels, COLLECTOR_ID)[0])
+    assert "sqlite_autoindex_channels_1" in plan, plan
+
+def test_coin_orders_by_status_use_status_index(db):
+    plan = query_plan(db, "SELECT * FROM coin_orders WHERE status = 'pending' ORDER BY created_at LIMIT 20")
+    assert "idx_coin_orders_status" in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
@@ -0,0 +1,28 @@
+# tests/test_rows.py
+"""
+توابعی که ردیف را به هندلرها می‌دهند dict معمولی برمی‌گردانند؛ ردیف‌های rows.py با copy() یا dict(row) به dict تبدیل می‌شوند.
+"""
+import json
+
+def test_user_records_are_plain_dicts(database):
+    database.add_user(1, "09001234567", 5)
+    order_id = database.create_coin_order(1, 10, 1000, "file")
+    records = [
+        database.get_user(1),
+        *database.get_all_users(),
+        *database.search_users("0900123"),
+        *database.get_users_page(0),
+        database.get_coin_order(order_id),
+    ]
+    for record in records:
+        assert type(record) is dict
+        json.dumps(record)
+    user = database.get_user(1)
+    user["coin_balance"] += 1
+    assert database.get_user(1)["coin_balance"] == 5
+
+def test_feed_rows_convert_to_dicts(database):
+    database.create_subscriber_order(2, "@channel", 10)
+    [row] = database.get_recent_orders(1)
+    assert dict(row) == row.copy() == row
+    assert json.loads(json.dumps(row.copy()))["channel_username"] == "@channel"
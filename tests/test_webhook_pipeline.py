@@ -0,0 +1,72 @@
+# tests/test_webhook_pipeline.py
+"""
+راه‌اندازی ناموفق UpdatePipeline (مثلاً خطای موقت شبکه در initialize) در درخواست بعدی دوباره تلاش می‌شود.
+"""
+import sys
+
+import pytest
+
+from conftest import load_module, make_config
+
+pytest.importorskip("telegram")
+
+class FlakyApplication:
+    """جایگزین bot_app که initialize آن در اولین تلاش خطا می‌دهد"""
+
+    def __init__(self, failures=1):
+        self.failures = failures
+        self.initialize_calls = 0
+        self.shutdown_calls = 0
+        self.running = False
+        self.job_queue = None
+
+    async def initialize(self):
+        self.initialize_calls += 1
+        if self.initialize_calls <= self.failures:
+            raise ConnectionError("network is unreachable")
+
+    async def start(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+
+    async def shutdown(self):
+        self.shutdown_calls += 1
+
+@pytest.fixture
+def webhook_pipeline(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "config", make_config(tmp_path / "test.db", WEBHOOK_START_TIMEOUT=5))
+    return load_module(monkeypatch, "webhook_pipeline")
+
+@pytest.mark.parametrize("mode", ["queue", "inline"])
+def test_failed_startup_is_retried(webhook_pipeline, mode):
+    application = FlakyApplication()
+    pipeline = webhook_pipeline.UpdatePipeline(application, workers=2, mode=mode)
+    with pytest.raises(ConnectionError):
+        pipeline.ensure_started()
+    assert application.shutdown_calls == 1
+
+    pipeline.ensure_started()
+    try:
+        assert application.initialize_calls == 2
+        assert application.running
+        # در حالت inline ارسال‌های پس‌زمینه (مثل پیام همگانی) به maintenance.py سپرده می‌شوند
+        assert webhook_pipeline.inline_mode_active() == (mode == "inline")
+    finally:
+        pipeline.stop()
+
+def test_processes_mode_allows_a_single_dispatcher(webhook_pipeline):
+    if webhook_pipeline.fcntl is None:
+        pytest.skip("fcntl is not available")
+    first = webhook_pipeline.ProcessPipeline(processes=1)
+    second = webhook_pipeline.ProcessPipeline(processes=1)
+    first._claim_single_dispatcher()
+    try:
+        # worker دوم سرور WSGI
+        with pytest.raises(RuntimeError, match="single WSGI worker"):
+            second._claim_single_dispatcher()
+    finally:
+        first._lock_file.close()
+    second._claim_single_dispatcher()
+    second._lock_file.close()
@@ -0,0 +1,57 @@
+# tests/test_write_behind.py
+import threading
+
+def test_order_increments_are_written_through_and_capped(database):
+    database.enable_write_behind(flush_interval=60)
+    order_id = database.create_subscriber_order(1, "@full", 2)
+    for _ in range(3):
+        database.update_order_current(order_id)
+    # بدون flush: ظرفیت سفارش بلافاصله برای همه‌ی خواندن‌ها دیده می‌شود و بیش از required پر نمی‌شود
+    assert not database.has_active_order(1, "@full")
+    assert database.get_available_coin_orders(1) == []
+    order = database.get_connection().execute(
+        "SELECT current FROM subscriber_orders WHERE order_id = ?", (order_id,)).fetchone()
+    assert order["current"] == 2
+
+def test_pending_warnings_are_visible_before_flush(database):
+    database.add_user(1, "0900", 0)
+    database.enable_write_behind(flush_interval=60)
+    database.update_user_warnings(1, 2)
+    assert database.get_user_warnings(1) == 2
+    database.flush_pending_writes()
+    assert database.get_user_warnings(1) == 2
+
+def test_pending_transactions_are_listed_before_flush(database):
+    database.add_transaction("direct", 1, "written")
+    database.enable_write_behind(flush_interval=60)
+    database.add_transaction("buffered", 2, "pending")
+    assert [tx["type"] for tx in database.get_transactions(2)] == ["buffered", "direct"]
+    database.flush_pending_writes()
+    assert [tx["type"] for tx in database.get_transactions(2)] == ["buffered", "direct"]
+
+def test_reader_during_flush_commit_counts_warnings_once(database, monkeypatch):
+    database.add_user(1, "0900", 0)
+    buffer = database.enable_write_behind(flush_interval=60)
+    database.update_user_warnings(1, 1)
+    readings = []
+    readers = []
+    commit = database.PooledConnection.commit
+
+    def read():
+        readings.append(database.get_user_warnings(1))
+        database.close_connection()
+
+    def commit_then_read(conn):
+        # خواندن درست بعد از commit بافر و پیش از پاک شدن تغییراتش از بافر
+        commit(conn)
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(0.2)
+        readers.append(reader)
+
+    monkeypatch.setattr(database.PooledConnection, "commit", commit_then_read)
+    buffer.flush()
+    monkeypatch.setattr(database.PooledConnection, "commit", commit)
+    for reader in readers:
+        reader.join()
+    assert readings == [1]
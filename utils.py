@@ -1,7 +1,9 @@
 # handlers/utils.py
-import datetime
+import asyncio
 from telegram import ReplyKeyboardMarkup
+import config
 import database
+from cache import TTLCache
 
 # دکمه‌های عمومی
 BUTTON_MAIN_MENU = "🔙 بازگشت"
@@ -9,6 +11,71 @@ BUTTON_CANCEL = "🔙 بازگشت به منوی اصلی"
 BUTTON_CHECK_MEMBERSHIP = "🔄 بررسی عضویت"
 BUTTON_FORCED_MEMBERSHIP_SETTINGS = "⚙️ تنظیمات عضویت اجباری"  # جهت مدیریت (این دکمه در منوی اصلی استفاده نمی‌شود)
 
+JOINED_STATUSES = ("member", "administrator", "creator")
+
+# کش نتیجه‌ی get_chat_member به ازای (user_id, کانال)؛ نتیجه‌ی منفی زودتر منقضی می‌شود
+MEMBERSHIP_CACHE_TTL = getattr(config, "MEMBERSHIP_CACHE_TTL", 300)
+MEMBERSHIP_CACHE_NEGATIVE_TTL = getattr(config, "MEMBERSHIP_CACHE_NEGATIVE_TTL", 20)
+MEMBERSHIP_CACHE_SIZE = getattr(config, "MEMBERSHIP_CACHE_SIZE", 50000)
+membership_cache = TTLCache(maxsize=MEMBERSHIP_CACHE_SIZE, ttl=MEMBERSHIP_CACHE_TTL)
+
+# حداکثر تعداد درخواست همزمان get_chat_member برای یک کاربر و مهلت هر درخواست (ثانیه)
+MEMBERSHIP_CHECK_CONCURRENCY = getattr(config, "MEMBERSHIP_CHECK_CONCURRENCY", 5)
+MEMBERSHIP_CHECK_TIMEOUT = getattr(config, "MEMBERSHIP_CHECK_TIMEOUT", 5)
+
+# فاصله‌ی اجرای job حذف کانال‌های اجباری منقضی‌شده (ثانیه)
+FORCED_CHANNEL_SWEEP_INTERVAL = getattr(config, "FORCED_CHANNEL_SWEEP_INTERVAL", 60)
+
+def remember_membership(user_id, channel_username, joined):
+    """ثبت وضعیت عضویت در کش (مثبت با TTL عادی و منفی با TTL کوتاه‌تر)"""
+    ttl = MEMBERSHIP_CACHE_TTL if joined else MEMBERSHIP_CACHE_NEGATIVE_TTL
+    membership_cache.set((user_id, channel_username), joined, ttl=ttl)
+
+def _on_forced_channel_changed(event, channel_username):
+    # با حذف یا ثبت دوباره‌ی کانال، نتایج قبلی آن کانال دیگر معتبر نیستند
+    if event in ("added", "removed"):
+        membership_cache.discard_where(lambda key: key[1] == channel_username)
+
+database.add_forced_channel_listener(_on_forced_channel_changed)
+
+async def is_channel_member(context, channel_username, user_id, use_cache=True):
+    """
+    بررسی عضویت کاربر در کانال با استفاده از کش.
+    با use_cache=False کش (مثبت و منفی) نادیده گرفته می‌شود، مثلاً برای دیدن خروج تازه‌ی کاربر از کانال؛
+    پاسخ تازه در هر حال در کش ذخیره می‌شود. خطای API مثل عدم عضویت در نظر گرفته می‌شود.
+    """
+    if use_cache:
+        cached = membership_cache.get((user_id, channel_username))
+        if cached is not None:
+            return cached
+    try:
+        member = await context.bot.get_chat_member(chat_id=channel_username, user_id=user_id)
+        joined = member.status in JOINED_STATUSES
+    except Exception:
+        joined = False
+    remember_membership(user_id, channel_username, joined)
+    return joined
+
+async def check_memberships(context, channel_usernames, user_id, use_cache=True):
+    """
+    بررسی همزمان عضویت کاربر در چند کانال با سقف MEMBERSHIP_CHECK_CONCURRENCY درخواست.
+    خروجی دیکشنری از نام کانال به True/False است؛ خطا یا پایان مهلت یعنی عضو نیست.
+    """
+    semaphore = asyncio.Semaphore(MEMBERSHIP_CHECK_CONCURRENCY)
+
+    async def check(channel_username):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    is_channel_member(context, channel_username, user_id, use_cache=use_cache),
+                    timeout=MEMBERSHIP_CHECK_TIMEOUT,
+                )
+            except Exception:
+                return False
+
+    results = await asyncio.gather(*(check(channel_username) for channel_username in channel_usernames))
+    return dict(zip(channel_usernames, results))
+
 def get_main_menu_keyboard():
     """ایجاد صفحه کلید منوی اصلی با دکمه‌های صحیح"""
     keyboard = [
@@ -30,55 +97,21 @@ async def send_main_menu(update, context):
 async def check_forced_subscription(update, context, user_id):
     """
     بررسی عضویت اجباری:
-      - ابتدا لیست کانال‌های فعال اجباری دریافت می‌شود.
-      - برای هر کانال، وضعیت محدودیت زمانی یا تعداد بررسی می‌شود؛ در صورت منقضی شدن، کانال حذف می‌شود.
-      - سپس وضعیت عضویت کاربر در کانال‌های باقیمانده بررسی شده و در صورت عدم عضویت کاربر، پیام درخواست عضویت ارسال می‌شود.
+      - لیست کانال‌های اجباری که هنوز مهلت یا ظرفیت دارند از نسخه‌ی حافظه‌ی دیتابیس دریافت می‌شود.
+        (حذف کانال‌های منقضی‌شده در job دوره‌ای expire_forced_channels_job انجام می‌شود.)
+      - سپس وضعیت عضویت کاربر در این کانال‌ها بررسی شده و در صورت عدم عضویت کاربر، پیام درخواست عضویت ارسال می‌شود.
       - در این تابع، اعلان مدیر صرفاً حذف شده و فقط پیام نهایی به کاربر ارسال می‌شود.
     """
-    active_channels = database.get_active_forced_channels()
-    valid_channels = []
-    now = datetime.datetime.now()
-
-    for channel in active_channels:
-        channel_username = channel["channel_username"]
-        limit_type = channel["limit_type"]
-        limit_value = channel["limit_value"]
-
-        if limit_type == "time":
-            try:
-                expiration = datetime.datetime.fromisoformat(limit_value)
-            except ValueError:
-                continue
-            if now < expiration:
-                valid_channels.append(channel)
-            else:
-                database.remove_forced_channel(channel_username)
-                # اعلان پایان عضویت برای مدیر در اینجا حذف شده است.
-        elif limit_type == "members":
-            try:
-                required_members = int(limit_value)
-                current_members = int(channel.get("current_members", "0"))
-            except ValueError:
-                continue
-            if current_members < required_members:
-                valid_channels.append(channel)
-            else:
-                database.remove_forced_channel(channel_username)
-                # اعلان پایان عضویت برای مدیر حذف شده است.
+    valid_channels = await database.aio.get_valid_forced_channels()
 
     # اگر هیچ کانال عضویت اجباری فعال وجود نداشته باشد، کاربر بدون محدودیت وارد می‌شود.
     if not valid_channels:
         return False
 
-    not_joined = []
-    for channel in valid_channels:
-        channel_username = channel["channel_username"]
-        try:
-            member = await context.bot.get_chat_member(chat_id=channel_username, user_id=user_id)
-            if member.status not in ["member", "administrator", "creator"]:
-                not_joined.append(channel_username)
-        except Exception:
-            not_joined.append(channel_username)
+    memberships = await check_memberships(
+        context, [channel["channel_username"] for channel in valid_channels], user_id
+    )
+    not_joined = [channel_username for channel_username, joined in memberships.items() if not joined]
 
     if not_joined:
         message = "❗ لطفاً ابتدا در کانال‌های زیر عضو شوید:\n" + "\n".join(not_joined)
@@ -96,17 +129,20 @@ async def confirm_membership(update, context):
     در این نسخه هیچ پیغام به مدیر ارسال نمی‌شود؛ فقط پیام نهایی به کاربر ارسال می‌شود.
     """
     user_id = update.effective_user.id
-    active_channels = database.get_active_forced_channels()
+    active_channels = await database.aio.get_valid_forced_channels()
     successfully_joined = []
 
-    for channel in active_channels:
-        channel_username = channel["channel_username"]
+    # کاربر تازه دکمه‌ی بررسی را زده است؛ نتیجه‌ی منفی کش‌شده معتبر نیست
+    memberships = await check_memberships(
+        context, [channel["channel_username"] for channel in active_channels], user_id, use_cache=False
+    )
+
+    for channel_username, joined in memberships.items():
         try:
-            member = await context.bot.get_chat_member(chat_id=channel_username, user_id=user_id)
-            if member.status in ["member", "administrator", "creator"]:
-                if not database.is_user_joined_forced_channel(user_id, channel_username):
-                    database.add_joined_channel(user_id, channel_username, join_type="forced")
-                    database.increment_forced_channel_count(channel_username)
+            if joined:
+                if not await database.aio.is_user_joined_forced_channel(user_id, channel_username):
+                    await database.aio.add_joined_channel(user_id, channel_username, join_type="forced")
+                    await database.aio.increment_forced_channel_count(channel_username)
                     successfully_joined.append(channel_username)
         except Exception:
             pass
@@ -126,7 +162,15 @@ async def confirm_membership(update, context):
 # def notify_admin(context, message):
 #     ...
 
+async def expire_forced_channels_job(context):
+    """job دوره‌ای: حذف کانال‌های اجباری که مهلت یا ظرفیتشان تمام شده است"""
+    await database.aio.expire_forced_channels()
+
 def register_force_check_handler(app):
-    """ثبت هندلر برای دکمه بررسی عضویت"""
+    """ثبت هندلر برای دکمه بررسی عضویت و job حذف کانال‌های منقضی‌شده"""
     from telegram.ext import MessageHandler, filters
-    app.add_handler(MessageHandler(filters.Regex(f"^{BUTTON_CHECK_MEMBERSHIP}$"), confirm_membership))
\ No newline at end of file
+    app.add_handler(MessageHandler(filters.Regex(f"^{BUTTON_CHECK_MEMBERSHIP}$"), confirm_membership))
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(
+            expire_forced_channels_job, interval=FORCED_CHANNEL_SWEEP_INTERVAL, first=0, name="expire_forced_channels"
+        )
\ No newline at end of file
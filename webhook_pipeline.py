@@ -0,0 +1,407 @@
+# webhook_pipeline.py
+import asyncio
+import atexit
+import importlib
+import multiprocessing
+import os
+import queue as queue_module
+import threading
+import time
+import zlib
+from concurrent.futures import TimeoutError as FutureTimeoutError
+try:
+    import fcntl
+except ImportError:  # ویندوز؛ بررسی تک‌worker بودن سرور WSGI انجام نمی‌شود
+    fcntl = None
+from telegram import Update
+import config
+import metrics
+
+# تنظیمات صف وب‌هوک (در صورت نبود در config مقدار پیش‌فرض استفاده می‌شود)
+WEBHOOK_WORKERS = getattr(config, "WEBHOOK_WORKERS", 8)
+WEBHOOK_QUEUE_SIZE = getattr(config, "WEBHOOK_QUEUE_SIZE", 1000)
+WEBHOOK_ENQUEUE_TIMEOUT = getattr(config, "WEBHOOK_ENQUEUE_TIMEOUT", 2.0)
+# حداکثر انتظار (ثانیه) برای راه‌اندازی رشته‌ی حلقه‌ی رویداد در حالت queue؛ پس از آن حالت inline استفاده می‌شود
+WEBHOOK_START_TIMEOUT = getattr(config, "WEBHOOK_START_TIMEOUT", 30)
+
+def _threads_available():
+    """
+    False در میزبان‌هایی که رشته‌های ساخته‌شده توسط برنامه را اجرا نمی‌کنند:
+    PythonAnywhere و uWSGI بدون enable-threads (یا threads).
+    """
+    if os.environ.get("PYTHONANYWHERE_DOMAIN") or os.environ.get("PYTHONANYWHERE_SITE"):
+        return False
+    try:
+        import uwsgi
+    except ImportError:
+        return True
+    return bool(uwsgi.opt.get("enable-threads") or uwsgi.opt.get("threads"))
+
+# "queue": حلقه‌ی رویداد در رشته‌ی پس‌زمینه و پاسخ فوری؛ "inline": برای میزبان‌هایی که رشته‌ی پس‌زمینه ندارند؛
+# "processes": پخش آپدیت‌ها بین چند پردازه‌ی worker که هر کدام bot_app خودشان را دارند.
+# پیش‌فرض بر اساس میزبان انتخاب می‌شود. در حالت inline حلقه فقط هنگام پردازش هر آپدیت اجرا می‌شود، پس
+# jobهای دوره‌ای (انقضای کانال‌ها، بازرسی عضویت، بایگانی و ادامه‌ی پیام همگانی) در آن اجرا نمی‌شوند
+# و باید با maintenance.py (مثلاً Scheduled task در PythonAnywhere) اجرا شوند. کارهای پس‌زمینه‌ی طولانی
+# (مثل ارسال پیام همگانی) هم فقط ثبت می‌شوند و ارسال آن‌ها با maintenance.py انجام می‌شود (inline_mode_active).
+WEBHOOK_MODE = getattr(config, "WEBHOOK_MODE", None) or ("queue" if _threads_available() else "inline")
+# تنظیمات حالت processes؛ این حالت فقط با یک worker در سرور WSGI درست کار می‌کند (ProcessPipeline)
+WEBHOOK_PROCESSES = getattr(config, "WEBHOOK_PROCESSES", multiprocessing.cpu_count())
+# فایل قفلی که فقط یک پردازه‌ی WSGI در حالت processes می‌تواند بگیرد
+WEBHOOK_PROCESSES_LOCK_FILE = getattr(config, "WEBHOOK_PROCESSES_LOCK_FILE", f"{config.DATABASE_NAME}.webhook.lock")
+# مسیر import اپلیکیشن در پردازه‌های worker به شکل "ماژول:نام"
+WEBHOOK_APP = getattr(config, "WEBHOOK_APP", "bot:bot_app")
+# spawn امن‌تر است (پردازه‌ی والد رشته‌های پس‌زمینه دارد)؛ fork سریع‌تر راه‌اندازی می‌شود
+WEBHOOK_START_METHOD = getattr(config, "WEBHOOK_START_METHOD", "spawn")
+
+# True اگر در این پردازه UpdatePipeline در حالت inline (از config یا پس از fallback) اجرا شده باشد
+_inline_active = False
+
+def inline_mode_active():
+    """
+    آیا حلقه‌ی رویداد این پردازه فقط هنگام پردازش آپدیت‌ها اجرا می‌شود؛ در این صورت taskهای پس‌زمینه
+    (application.create_task) بین آپدیت‌ها متوقف می‌مانند و نباید برای کارهای طولانی استفاده شوند.
+    """
+    return _inline_active
+
+def get_update_user_id(update):
+    """شناسه‌ی کاربر آپدیت برای تقسیم بین workerها (در نبود کاربر، شناسه‌ی آپدیت)"""
+    user = update.effective_user
+    return user.id if user is not None else update.update_id
+
+def get_update_user_id_from_json(data):
+    """
+    همان get_update_user_id روی JSON خام، بدون ساختن Update (برای توزیع‌کننده‌ی حالت processes).
+    کاربر در فیلد from (پیام، callback، inline و ...) یا user (poll_answer و ...) بخش اصلی آپدیت است.
+    """
+    for value in data.values():
+        if isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+    return data.get("update_id", 0)
+
+class UpdatePipeline:
+    """
+    پل بین وب‌هوک همگام Flask و bot_app روی یک حلقه‌ی رویداد ماندگار.
+    - حلقه و bot_app فقط یک بار (در اولین درخواست هر پردازه) راه‌اندازی می‌شوند؛
+      بنابراین با سرورهای WSGI که پس از import پردازه‌ها را fork می‌کنند (مثل PythonAnywhere) سازگار است.
+    - هر آپدیت بر اساس شناسه‌ی کاربر در یکی از N صف محدود قرار می‌گیرد و هر صف یک worker دارد؛
+      پس آپدیت‌های یک کاربر به ترتیب پردازش می‌شوند و وضعیت ConversationHandler به هم نمی‌ریزد.
+    - اگر صف پر باشد submit مقدار False برمی‌گرداند تا وب‌هوک با 503 پاسخ دهد و تلگرام بعداً دوباره بفرستد.
+    """
+
+    def __init__(self, application, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE, mode=WEBHOOK_MODE,
+                 run_jobs=True):
+        self.application = application
+        self.workers = max(1, workers)
+        self.queue_size = max(self.workers, queue_size)
+        self.mode = mode
+        # در حالت processes فقط یکی از workerها jobهای دوره‌ای را اجرا می‌کند
+        self.run_jobs = run_jobs
+        self._loop = None
+        self._queues = []
+        self._tasks = []
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._inline_lock = threading.Lock()
+        self._started = False
+        self._startup_error = None
+        # رشته‌ی حلقه فقط اگر این قفل را بگیرد شروع به کار می‌کند؛ با گرفتن آن رشته‌ی دیررس کنار گذاشته می‌شود
+        self._thread_claim = threading.Lock()
+
+    # ---------- راه‌اندازی و توقف ----------
+    def ensure_started(self):
+        global _inline_active
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            self._loop = asyncio.new_event_loop()
+            try:
+                if self.mode != "inline" and not self._start_thread():
+                    print(f"Webhook pipeline thread did not start within {WEBHOOK_START_TIMEOUT}s "
+                          f"(threads disabled on this host?); falling back to inline mode")
+                    self.mode = "inline"
+                if self.mode == "inline":
+                    self._start_inline()
+                    _inline_active = True
+            except Exception:
+                # راه‌اندازی ناموفق (مثلاً خطای موقت شبکه در initialize)؛ درخواست بعدی با حلقه‌ی تازه از ابتدا تلاش می‌کند
+                if self._thread is None:
+                    self._loop.close()
+                self._loop = None
+                raise
+            self._started = True
+            atexit.register(self.stop)
+
+    def _start_thread(self):
+        """راه‌اندازی رشته‌ی حلقه؛ False اگر رشته در WEBHOOK_START_TIMEOUT اجرا نشود"""
+        ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run_loop, args=(ready,), name="webhook-pipeline", daemon=True
+        )
+        self._thread.start()
+        if not ready.wait(WEBHOOK_START_TIMEOUT) and self._thread_claim.acquire(blocking=False):
+            # رشته هنوز شروع نشده و دیگر شروع نخواهد شد
+            self._thread = None
+            return False
+        # رشته شروع شده است؛ راه‌اندازی bot_app (initialize و start) در حال انجام است
+        if not ready.wait(WEBHOOK_START_TIMEOUT):
+            raise RuntimeError("Webhook pipeline startup timed out")
+        if self._startup_error is not None:
+            # رشته پس از ثبت خطا و آزاد کردن قفل تمام می‌شود
+            error, self._startup_error = self._startup_error, None
+            self._thread.join()
+            self._thread = None
+            raise error
+        return True
+
+    def _run_loop(self, ready):
+        if not self._thread_claim.acquire(blocking=False):
+            return
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._start_application())
+            self._loop.run_until_complete(self._start_workers())
+        except Exception as e:
+            self._loop.run_until_complete(self._abort_application())
+            self._startup_error = e
+            # رشته‌ی تلاش بعدی باید بتواند قفل را بگیرد
+            self._thread_claim.release()
+            return
+        finally:
+            ready.set()
+        self._loop.run_forever()
+
+    def _start_inline(self):
+        try:
+            self._loop.run_until_complete(self._start_application())
+        except Exception:
+            self._loop.run_until_complete(self._abort_application())
+            raise
+
+    async def _start_application(self):
+        await self.application.initialize()
+        # start برای اجرای job_queue (مثل حذف کانال‌های اجباری منقضی‌شده) لازم است
+        await self.application.start()
+        # در حالت inline حلقه بین آپدیت‌ها متوقف است؛ jobها با maintenance.py اجرا می‌شوند
+        if (not self.run_jobs or self.mode == "inline") and self.application.job_queue is not None:
+            for job in self.application.job_queue.jobs():
+                job.schedule_removal()
+
+    async def _abort_application(self):
+        """خاموش کردن bot_app نیمه‌راه‌اندازی‌شده تا تلاش بعدی روی حلقه‌ی تازه از initialize شروع کند"""
+        try:
+            if self.application.running:
+                await self.application.stop()
+            await self.application.shutdown()
+        except Exception as e:
+            print("Webhook pipeline cleanup error:", e)
+
+    async def _start_workers(self):
+        shard_size = self.queue_size // self.workers
+        self._queues = [asyncio.Queue(maxsize=shard_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def _worker(self, queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self._process(update)
+            except Exception as e:
+                print("Update processing error:", e)
+            finally:
+                queue.task_done()
+
+    async def _process(self, update):
+        started = time.perf_counter()
+        try:
+            await self.application.process_update(update)
+        finally:
+            metrics.update_seconds.observe(time.perf_counter() - started)
+
+    def stop(self):
+        """پردازش آپدیت‌های باقیمانده در صف و خاموش کردن bot_app"""
+        if not self._started:
+            return
+        self._started = False
+        if self.mode == "inline":
+            self._loop.run_until_complete(self._shutdown())
+            self._loop.close()
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        try:
+            future.result(timeout=30)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    async def _shutdown(self):
+        for queue in self._queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        if self.application.running:
+            await self.application.stop()
+        await self.application.shutdown()
+
+    # ---------- دریافت آپدیت ----------
+    def submit(self, data):
+        """
+        ثبت JSON یک آپدیت از رشته‌ی وب‌هوک.
+        در حالت queue بلافاصله برمی‌گردد؛ False یعنی صف پر است و باید 503 برگردانده شود.
+        """
+        self.ensure_started()
+        update = Update.de_json(data, self.application.bot)
+        if self.mode == "inline":
+            with self._inline_lock:
+                self._loop.run_until_complete(self._process(update))
+            return True
+        future = asyncio.run_coroutine_threadsafe(self._enqueue(update), self._loop)
+        try:
+            return future.result(timeout=WEBHOOK_ENQUEUE_TIMEOUT)
+        except FutureTimeoutError:
+            future.cancel()
+            return False
+
+    async def _enqueue(self, update):
+        queue = self._queues[hash(get_update_user_id(update)) % self.workers]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+# ==================== حالت چندپردازه‌ای ====================
+def _load_application(app_path):
+    module_name, _, attribute = app_path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "bot_app")
+
+def _process_worker(app_path, updates, run_jobs):
+    """
+    حلقه‌ی اصلی هر پردازه‌ی worker: ساختن bot_app خودش، de_json و پردازش آپدیت‌ها با UpdatePipeline محلی.
+    آپدیت‌ها به همان ترتیب رسیدن تحویل داده می‌شوند؛ اگر صف محلی پر باشد همان آپدیت دوباره امتحان می‌شود.
+    """
+    pipeline = UpdatePipeline(_load_application(app_path), mode="queue", run_jobs=run_jobs)
+    pipeline.ensure_started()
+    try:
+        while True:
+            data = updates.get()
+            if data is None:
+                break
+            while not pipeline.submit(data):
+                time.sleep(0.05)
+    finally:
+        pipeline.stop()
+
+class ProcessPipeline:
+    """
+    توزیع‌کننده‌ی آپدیت‌ها بین چند پردازه‌ی worker تا decode و هندلرها از چند هسته استفاده کنند.
+    - شناسه‌ی کاربر از JSON خام خوانده و با crc32 به یکی از N پردازه نگاشته می‌شود؛ هر پردازه صف خودش را دارد،
+      پس آپدیت‌های یک کاربر همیشه به یک پردازه و به ترتیب می‌رسند و وضعیت ConversationHandler درست می‌ماند.
+    - هر worker اپلیکیشن WEBHOOK_APP را خودش import می‌کند و اتصال SQLite (WAL) خودش را دارد.
+    - jobهای دوره‌ای فقط در worker شماره‌ی صفر اجرا می‌شوند.
+    - رابط آن مثل UpdatePipeline است: submit مقدار False برمی‌گرداند اگر صف آن worker پر باشد.
+    - سرور WSGI باید فقط یک worker داشته باشد: هر worker WSGI پردازه‌های خودش را می‌سازد، پس ترتیب آپدیت‌های
+      یک کاربر فقط داخل یک worker حفظ می‌شود و سهم نرخ خروجی (OUTBOUND_GLOBAL_RATE / processes) چند برابر می‌شود.
+      برای همین اولین worker فایل WEBHOOK_PROCESSES_LOCK_FILE را قفل می‌کند و بقیه با خطا راه‌اندازی نمی‌شوند.
+      /metrics هم فقط مقادیر پردازه‌ی توزیع‌کننده را نشان می‌دهد، نه پردازه‌های worker.
+    """
+
+    def __init__(self, app_path=WEBHOOK_APP, processes=WEBHOOK_PROCESSES, queue_size=WEBHOOK_QUEUE_SIZE,
+                 start_method=WEBHOOK_START_METHOD):
+        self.app_path = app_path
+        self.processes = max(1, processes)
+        self.queue_size = max(1, queue_size // self.processes)
+        self.start_method = start_method
+        self._context = None
+        self._queues = []
+        self._workers = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._lock_file = None
+
+    def ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._claim_single_dispatcher()
+            self._context = multiprocessing.get_context(self.start_method)
+            self._queues = [self._context.Queue(self.queue_size) for _ in range(self.processes)]
+            self._workers = [None] * self.processes
+            for index in range(self.processes):
+                self._start_worker(index)
+            self._started = True
+            atexit.register(self.stop)
+
+    def _claim_single_dispatcher(self):
+        """قفل WEBHOOK_PROCESSES_LOCK_FILE؛ اگر worker دیگری از سرور WSGI آن را گرفته باشد RuntimeError"""
+        if fcntl is None or self._lock_file is not None:
+            return
+        lock_file = open(WEBHOOK_PROCESSES_LOCK_FILE, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(
+                "WEBHOOK_MODE='processes' needs a single WSGI worker: another process already dispatches updates "
+                f"({WEBHOOK_PROCESSES_LOCK_FILE} is locked). Run the WSGI server with one worker, "
+                "or use WEBHOOK_MODE='queue' with several WSGI workers."
+            ) from None
+        self._lock_file = lock_file
+
+    def _start_worker(self, index):
+        worker = self._context.Process(
+            target=_process_worker,
+            args=(self.app_path, self._queues[index], index == 0),
+            name=f"webhook-worker-{index}",
+            daemon=True,
+        )
+        worker.start()
+        self._workers[index] = worker
+
+    def _shard(self, data):
+        user_id = get_update_user_id_from_json(data)
+        return zlib.crc32(str(user_id).encode()) % self.processes
+
+    def submit(self, data):
+        """ارسال JSON آپدیت به پردازه‌ی مسئول آن کاربر؛ False یعنی صف پر است و باید 503 برگردانده شود"""
+        self.ensure_started()
+        index = self._shard(data)
+        if not self._workers[index].is_alive():
+            with self._lock:
+                if not self._workers[index].is_alive():
+                    print(f"Webhook worker {index} exited with code {self._workers[index].exitcode}; restarting")
+                    self._start_worker(index)
+        try:
+            self._queues[index].put(data, timeout=WEBHOOK_ENQUEUE_TIMEOUT)
+        except queue_module.Full:
+            return False
+        return True
+
+    def stop(self):
+        """ارسال علامت پایان به workerها تا صف‌هایشان را خالی کنند و bot_app خودشان را خاموش کنند"""
+        if not self._started:
+            return
+        self._started = False
+        for updates in self._queues:
+            try:
+                updates.put(None, timeout=5)
+            except queue_module.Full:
+                pass
+        for worker in self._workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                worker.terminate()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+def create_pipeline(application, mode=WEBHOOK_MODE):
+    """ساخت صف وب‌هوک بر اساس WEBHOOK_MODE؛ در حالت processes خود application در این پردازه اجرا نمی‌شود"""
+    if mode == "processes":
+        return ProcessPipeline()
+    return UpdatePipeline(application, mode=mode)